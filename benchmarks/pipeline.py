@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+细胞词库解析和 Rime 词典生成的基准测试。
+
+对每种规模和文件头类型生成合成细胞词库，分别计时 get_dict_meta、syllable_table、word_table、
+unique_words 和 write_records（命令行实际使用的写出路径），报告每个阶段的吞吐量（词/秒、MB/秒）以及峰值内存。
+每个阶段重复 --repeat 次取最短耗时；每个用例在独立的子进程中运行，峰值内存互不影响。
+
+    python benchmarks/pipeline.py --sizes 10000 1000000 --output result.json
+    python benchmarks/pipeline.py --baseline result.json --tolerance 0.2 --min-seconds 0.005
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scel_transfer  # noqa: E402
+from scel_writer import write_synthetic_scel  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+DEFAULT_MASKS = (0x44, 0x45)
+STAGES = ("get_dict_meta", "syllable_table", "word_table", "unique_words", "write_records")
+DEFAULT_REPEAT = 3
+# 与基线比较时，耗时增加不超过这个秒数的阶段不算退化，避免亚毫秒级阶段的计时抖动触发失败
+DEFAULT_MIN_SECONDS = 0.005
+
+
+def scel_path(workdir, size, mask):
+    """
+    生成（或复用已生成的）合成细胞词库。
+    """
+    path = os.path.join(workdir, "synthetic_{}_{:#x}.scel".format(size, mask))
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        write_synthetic_scel(tmp, size, mask)
+        os.replace(tmp, path)
+    return path
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 的单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_result(seconds, words, nbytes):
+    return {
+        "seconds": seconds,
+        "words": words,
+        "bytes": nbytes,
+        "words_per_second": words / seconds if seconds else None,
+        "mb_per_second": nbytes / seconds / (1 << 20) if seconds else None,
+    }
+
+
+def timed(repeat, func, *args, setup=None):
+    """
+    运行 func repeat 次，返回最后一次的结果和最短耗时。setup 不为 None 时在每次运行前调用，不计入耗时。
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        value = func(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return value, best
+
+
+def reset_spell_memo():
+    # 每次解析都从空的全拼缓存开始，否则重复运行时全部命中，测不到解码全拼的开销
+    scel_transfer.SPELL_MEMO = scel_transfer.SpellMemo(scel_transfer.SPELL_MEMO.maxsize)
+
+
+def run_case(workdir, size, mask, parser, repeat=DEFAULT_REPEAT):
+    """
+    在当前进程中运行一个用例，返回各阶段的结果。
+    """
+    scel = scel_path(workdir, size, mask)
+    file_size = os.path.getsize(scel)
+    case_dir = os.path.join(workdir, "case_{}_{:#x}".format(size, mask))
+    cn_dicts = os.path.join(case_dir, "cn_dicts")
+    os.makedirs(cn_dicts, exist_ok=True)
+    stages = {}
+
+    with open(scel, "rb") as fp:
+        hz_offset = scel_transfer.get_hz_offset(fp)
+        _, seconds = timed(repeat, scel_transfer.get_dict_meta, fp)
+        stages["get_dict_meta"] = stage_result(seconds, 0, 0x1540 - 0x130)
+        syllables, seconds = timed(repeat, scel_transfer.syllable_table, fp)
+        stages["syllable_table"] = stage_result(seconds, 0, hz_offset - 0x1540)
+
+    (meta, records), seconds = timed(repeat, scel_transfer.read_scel, scel, True, parser, setup=reset_spell_memo)
+    stages["word_table"] = stage_result(seconds, len(records), file_size - hz_offset)
+
+    # 已有词典收录一半的词语，去重时一半的记录会被过滤
+    existing = os.path.join(cn_dicts, "existing.dict.yaml")
+    scel_transfer.write_records(existing, records[::2], header="---\nname: existing\n...")
+    uniq, seconds = timed(repeat, scel_transfer.unique_words, cn_dicts, records)
+    stages["unique_words"] = stage_result(seconds, len(records), os.path.getsize(existing))
+
+    output = os.path.join(case_dir, "output.txt")
+    _, seconds = timed(repeat, scel_transfer.write_records, output, records)
+    stages["write_records"] = stage_result(seconds, len(records), os.path.getsize(output))
+
+    return {
+        "size": size,
+        "mask": "{:#x}".format(mask),
+        "parser": parser,
+        "file_bytes": file_size,
+        "words": len(records),
+        "unique_words": len(uniq),
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_case_subprocess(workdir, size, mask, parser, repeat=DEFAULT_REPEAT):
+    cmd = [sys.executable, os.path.abspath(__file__), "--workdir", workdir, "--parser", parser]
+    cmd += ["--repeat", str(repeat)]
+    cmd += ["--case", str(size), str(mask)]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(out)
+
+
+def print_case(case):
+    print(
+        "== {} 个词语，文件头 {}，解析方式 {}，峰值内存 {:.1f} MB".format(
+            case["size"], case["mask"], case["parser"], case["peak_rss_mb"]
+        )
+    )
+    for stage in STAGES:
+        result = case["stages"][stage]
+        line = "  {:<15} {:>9.4f} 秒".format(stage, result["seconds"])
+        if result["words"] and result["words_per_second"]:
+            line += "  {:>13,.0f} 词/秒".format(result["words_per_second"])
+        if result["mb_per_second"]:
+            line += "  {:>9.2f} MB/秒".format(result["mb_per_second"])
+        print(line)
+
+
+def compare(cases, baseline, tolerance, min_seconds=DEFAULT_MIN_SECONDS):
+    """
+    与基线结果比较各阶段耗时，返回超出容忍度的退化项。耗时增加不超过 min_seconds 的阶段不算退化，
+    基线中没有的阶段（例如旧版本的结果）不做比较。
+    """
+    base = {(c["size"], c["mask"], c["parser"]): c for c in baseline["cases"]}
+    regressions = []
+    for case in cases:
+        old = base.get((case["size"], case["mask"], case["parser"]))
+        if old is None:
+            continue
+        for stage in STAGES:
+            if stage not in old["stages"]:
+                continue
+            new_seconds, old_seconds = case["stages"][stage]["seconds"], old["stages"][stage]["seconds"]
+            if old_seconds and new_seconds > old_seconds * (1 + tolerance) and new_seconds - old_seconds > min_seconds:
+                regressions.append((case["size"], case["mask"], stage, old_seconds, new_seconds))
+        if case["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((case["size"], case["mask"], "peak_rss_mb", old["peak_rss_mb"], case["peak_rss_mb"]))
+    return regressions
+
+
+def args():
+    ap = argparse.ArgumentParser(description="细胞词库解析和 Rime 词典生成的基准测试。")
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="词语数量，默认 10K、1M、10M。")
+    ap.add_argument(
+        "--masks",
+        type=lambda x: int(x, 0),
+        nargs="+",
+        default=DEFAULT_MASKS,
+        help="文件头类型，默认 0x44 和 0x45。",
+    )
+    ap.add_argument("--parser", choices=scel_transfer.PARSERS, default="stream", help="词组表的解析方式。")
+    ap.add_argument(
+        "--workdir",
+        default=os.path.join(ROOT, ".benchmarks"),
+        help="存放合成词库和输出文件的目录，合成词库会被复用。",
+    )
+    ap.add_argument("--output", help="把结果写入 JSON 文件。")
+    ap.add_argument("--baseline", help="基线结果 JSON 文件，任一阶段比基线慢超过容忍度时以非零状态退出。")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="与基线比较时的容忍度，默认 0.2（20%%）。")
+    ap.add_argument(
+        "--min-seconds",
+        type=float,
+        default=DEFAULT_MIN_SECONDS,
+        help="与基线比较时，耗时增加不超过这个秒数的阶段不算退化，默认 %(default)s 秒。",
+    )
+    ap.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每个阶段的运行次数，取最短耗时，默认 %(default)s。")
+    ap.add_argument("--case", nargs=2, type=lambda x: int(x, 0), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.repeat < 1:
+        ap.error("'--repeat' 不能小于 1。")
+    return args
+
+
+def main(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.case:
+        json.dump(run_case(args.workdir, args.case[0], args.case[1], args.parser, args.repeat), sys.stdout)
+        return
+
+    cases = []
+    for size in args.sizes:
+        for mask in args.masks:
+            case = run_case_subprocess(args.workdir, size, mask, args.parser, args.repeat)
+            print_case(case)
+            cases.append(case)
+
+    result = {"python": sys.version, "cases": cases}
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as ofp:
+            json.dump(result, ofp, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf8") as fp:
+            regressions = compare(cases, json.load(fp), args.tolerance, args.min_seconds)
+        for size, mask, stage, old, new in regressions:
+            print("性能退化：{} 个词语，文件头 {}，{}：{:.4f} -> {:.4f}".format(size, mask, stage, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(args())
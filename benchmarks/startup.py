@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：在新的解释器中导入 scel_transfer 并转写一个很小的细胞词库，
+检查耗时是否在预算之内，超出预算时以非零状态退出。
+
+    python benchmarks/startup.py --budget 0.5 --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "scel_transfer.py")
+sys.path.insert(0, ROOT)
+
+from scel_transfer import DictMeta  # noqa: E402
+from scel_writer import write_scel  # noqa: E402
+
+
+def write_tiny_scel(path):
+    """
+    写出一个只包含两个同音词块的最小细胞词库。
+    """
+    meta = DictMeta("启动基准", "测试", "描述", "样例")
+    blocks = (([0, 1], [("你好", 1)]), ([2], [("做", 1)]))
+    write_scel(path, meta, blocks, syllables=("ni", "hao", "zuo"))
+
+
+def timed_run(cmd, cwd):
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def args():
+    ap = argparse.ArgumentParser(description="scel_transfer 启动耗时基准。")
+    ap.add_argument("--budget", type=float, default=0.5, help="导入并转写小词库的耗时预算（秒，取中位数），默认 0.5。")
+    ap.add_argument("--repeat", type=int, default=10, help="重复次数，默认 10。")
+    return ap.parse_args()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        scel = os.path.join(tmp, "tiny.scel")
+        write_tiny_scel(scel)
+        env_cmd = [sys.executable, "-c", "import sys; sys.path.insert(0, {!r}); import scel_transfer".format(ROOT)]
+        convert_cmd = [sys.executable, SCRIPT, "--scel", scel, "--output", os.path.join(tmp, "tiny.txt")]
+        imports = [timed_run(env_cmd, tmp) for _ in range(args.repeat)]
+        if os.path.exists(os.path.join(tmp, "py.log")):
+            sys.exit("导入模块时不应创建日志文件。")
+        converts = [timed_run(convert_cmd, tmp) for _ in range(args.repeat)]
+
+    import_time = statistics.median(imports)
+    convert_time = statistics.median(converts)
+    print("导入耗时（中位数）：{:.3f} 秒".format(import_time))
+    print("导入并转写耗时（中位数）：{:.3f} 秒，预算：{:.3f} 秒".format(convert_time, args.budget))
+    if convert_time > args.budget:
+        sys.exit("超出启动耗时预算。")
+
+
+if __name__ == "__main__":
+    main(args())
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+由细胞词库的 (词语, 全拼, 词频) 记录构造的拼音前缀树，按拼音前缀查询词频最高的 K 个词语，用于输入补全实验。
+
+记录按去掉空格的全拼排序后紧凑地存放在几个 bytes 和 array 中，前缀对应的记录是排序后的一段连续区间，
+通过二分查找定位。记录数超过 threshold 的前缀（树中的“重”结点）在构造时预先计算好前 top_k 个结果，
+其余前缀的区间很小，查询时直接扫描。可以保存到文件中，加载时不需要重新排序。
+
+    python pinyin_trie.py build -o vocab.trie foo.scel bar.scel
+    python pinyin_trie.py query vocab.trie nih zhongg
+    python pinyin_trie.py query vocab.trie          # 从标准输入逐行读取前缀
+"""
+
+import argparse
+import heapq
+import itertools
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+from scel_transfer import LOGGER, PARSERS, iter_scel
+
+DEFAULT_TOP_K = 10
+DEFAULT_THRESHOLD = 256
+
+
+def normalize(prefix):
+    """
+    查询和索引都使用去掉空格的小写全拼，"ni hao"、"nihao" 和 "nih" 都能匹配“你好”。
+    """
+    return prefix.replace(" ", "").lower()
+
+
+class _Slices:
+    """
+    把拼接的 bytes 和偏移数组当作 bytes 序列访问，可以直接用于 bisect。
+    """
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob, offsets) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]]
+
+
+def _joined(items):
+    blob = bytearray()
+    offsets = array("I", [0])
+    for item in items:
+        blob += item
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+class PinyinTrie:
+    """
+    - 分组：全拼相同的记录为一组，按 (去掉空格的全拼, 全拼) 排序，组内按词频从高到低排序
+    - keys / spells：每组去掉空格的全拼和原始全拼（ASCII），group_starts：每组第一条记录的编号
+    - words / freqs：每条记录的词语（UTF-8）和词频
+    - top：重结点的前缀 -> 预先计算的记录编号
+    """
+
+    MAGIC = b"PYTRIE\x00\x01"
+    HEADER = struct.Struct("<II")
+    SECTION = struct.Struct("<Q")
+
+    def __init__(self, keys, spells, group_starts, words, freqs, top, top_k, threshold) -> None:
+        self._keys = keys
+        self._spells = spells
+        self._group_starts = group_starts
+        self._words = words
+        self._freqs = freqs
+        self._top = top
+        self.top_k = top_k
+        self.threshold = threshold
+
+    def __len__(self):
+        return len(self._freqs)
+
+    def __repr__(self) -> str:
+        return "<PinyinTrie {} 条记录，{} 个全拼，{} 个预计算前缀>".format(len(self), len(self._keys), len(self._top))
+
+    @classmethod
+    def build(cls, records, top_k=DEFAULT_TOP_K, threshold=DEFAULT_THRESHOLD):
+        """
+        由 (词语, 全拼[, 词频]) 记录构造，没有词频的记录按词频 0 处理。
+        """
+        text, word_offsets = bytearray(), array("I", [0])
+        spell_ids, freqs = array("I"), array("I")
+        spells, spell_index = [], {}
+        for record in records:
+            text += record[0].encode("utf8")
+            word_offsets.append(len(text))
+            spell_id = spell_index.get(record[1])
+            if spell_id is None:
+                spell_id = spell_index[record[1]] = len(spells)
+                spells.append(record[1])
+            spell_ids.append(spell_id)
+            freqs.append(int(record[2]) if len(record) > 2 else 0)
+        del spell_index
+
+        by_key = sorted(range(len(spells)), key=lambda s: (normalize(spells[s]), spells[s]))
+        rank = array("I", bytes(4 * len(spells)))
+        for r, s in enumerate(by_key):
+            rank[s] = r
+        # 排序键打包为一个整数：分组序号、词频取反、记录编号，避免为每条记录构造元组
+        order = sorted(rank[spell_ids[i]] << 64 | (0xFFFFFFFF - freqs[i]) << 32 | i for i in range(len(freqs)))
+
+        sorted_words, sorted_offsets = bytearray(), array("I", [0])
+        sorted_freqs, group_starts = array("I"), array("I")
+        group = -1
+        for n, packed in enumerate(order):
+            i = packed & 0xFFFFFFFF
+            if packed >> 64 != group:
+                group = packed >> 64
+                group_starts.append(n)
+            sorted_words += text[word_offsets[i] : word_offsets[i + 1]]
+            sorted_offsets.append(len(sorted_words))
+            sorted_freqs.append(freqs[i])
+        group_starts.append(len(order))
+        del order, text
+
+        keys = _Slices(*_joined(normalize(spells[s]).encode("ascii") for s in by_key))
+        full_spells = _Slices(*_joined(spells[s].encode("ascii") for s in by_key))
+        words = _Slices(bytes(sorted_words), sorted_offsets)
+        trie = cls(keys, full_spells, group_starts, words, sorted_freqs, {}, top_k, threshold)
+        if len(keys):
+            trie._collect(b"", 0, len(keys))
+        return trie
+
+    def _best(self, ids, k):
+        # 词频相同时编号小的在前，预计算和直接扫描的结果一致
+        freqs = self._freqs
+        return heapq.nsmallest(k, ids, key=lambda i: (-freqs[i], i))
+
+    def _scan(self, lo, hi, k):
+        """
+        分组 [lo, hi) 中词频最高的 k 条记录，每组只需要看前 k 条。
+        """
+        starts = self._group_starts
+        ids = itertools.chain.from_iterable(
+            range(starts[g], min(starts[g + 1], starts[g] + k)) for g in range(lo, hi)
+        )
+        return self._best(ids, k)
+
+    def _collect(self, prefix, lo, hi):
+        """
+        计算前缀 prefix（对应分组 [lo, hi)）的前 top_k 个结果，重结点的结果由子结点的结果合并而来并记录在 top 中。
+        """
+        starts, keys, depth = self._group_starts, self._keys, len(prefix)
+        if starts[hi] - starts[lo] <= self.threshold:
+            return self._scan(lo, hi, self.top_k)
+        candidates = []
+        g = lo
+        while g < hi:
+            key = keys[g]
+            if len(key) == depth:
+                candidates.extend(range(starts[g], min(starts[g + 1], starts[g] + self.top_k)))
+                g += 1
+                continue
+            child = key[: depth + 1]
+            end = bisect_left(keys, child + b"\xff", g, hi)
+            candidates.extend(self._collect(child, g, end))
+            g = end
+        best = self._top[prefix] = self._best(candidates, self.top_k)
+        return best
+
+    def record(self, i):
+        group = bisect_left(self._group_starts, i + 1) - 1
+        return self._words[i].decode("utf8"), self._spells[group].decode("ascii"), str(self._freqs[i])
+
+    def query(self, prefix, k=DEFAULT_TOP_K):
+        """
+        返回全拼以 prefix 开头的记录中词频最高的 k 条 (词语, 全拼, 词频)。
+        """
+        try:
+            key = normalize(prefix).encode("ascii")
+        except UnicodeEncodeError:
+            return []
+        ids = self._top.get(key) if k <= self.top_k else None
+        if ids is None:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_left(self._keys, key + b"\xff", lo)
+            ids = self._scan(lo, hi, k)
+        return [self.record(i) for i in ids[:k]]
+
+    def _sections(self):
+        top_keys = sorted(self._top)
+        top_offsets = array("I", itertools.accumulate((len(self._top[p]) for p in top_keys), initial=0))
+        top_ids = array("I", itertools.chain.from_iterable(self._top[p] for p in top_keys))
+        prefixes, prefix_offsets = _joined(top_keys)
+        return (
+            self._keys.offsets, self._keys.blob,
+            self._spells.offsets, self._spells.blob,
+            self._group_starts,
+            self._words.offsets, self._words.blob,
+            self._freqs,
+            prefix_offsets, prefixes, top_offsets, top_ids,
+        )  # fmt: skip
+
+    def save(self, path):
+        with open(path, "wb") as ofp:
+            ofp.write(self.MAGIC + self.HEADER.pack(self.top_k, self.threshold))
+            for section in self._sections():
+                if isinstance(section, array) and sys.byteorder == "big":
+                    section = array(section.typecode, section)
+                    section.byteswap()
+                data = section.tobytes() if isinstance(section, array) else section
+                ofp.write(self.SECTION.pack(len(data)))
+                ofp.write(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError("不是拼音前缀树文件：{}".format(path))
+        pos = len(cls.MAGIC)
+        top_k, threshold = cls.HEADER.unpack_from(data, pos)
+        pos += cls.HEADER.size
+        sections = []
+        # 偶数位置为偏移数组或词频等整数数组，但 keys、spells、words 和 prefixes 是 bytes
+        blobs = {1, 3, 6, 9}
+        for n in range(12):
+            (size,) = cls.SECTION.unpack_from(data, pos)
+            pos += cls.SECTION.size
+            chunk = data[pos : pos + size]
+            pos += size
+            if n not in blobs:
+                chunk = array("I", chunk)
+                if sys.byteorder == "big":
+                    chunk.byteswap()
+            sections.append(chunk)
+        (key_offsets, keys, spell_offsets, spells, group_starts, word_offsets, words, freqs,
+         prefix_offsets, prefixes, top_offsets, top_ids) = sections  # fmt: skip
+        top = {
+            prefix: top_ids[top_offsets[i] : top_offsets[i + 1]]
+            for i, prefix in enumerate(_Slices(prefixes, prefix_offsets))
+        }
+        return cls(
+            _Slices(keys, key_offsets),
+            _Slices(spells, spell_offsets),
+            group_starts,
+            _Slices(words, word_offsets),
+            freqs,
+            top,
+            top_k,
+            threshold,
+        )
+
+
+def build(args):
+    records = itertools.chain.from_iterable(iter_scel(scel, True, args.parser)[1] for scel in args.scel)
+    start = time.perf_counter()
+    trie = PinyinTrie.build(records, args.top_k, args.threshold)
+    trie.save(args.output)
+    LOGGER.info("构造 %r，耗时 %.2f 秒。", trie, time.perf_counter() - start)
+    print(trie)
+
+
+def query(args):
+    trie = PinyinTrie.load(args.trie)
+    prefixes = args.prefix or (line.strip() for line in sys.stdin)
+    for prefix in prefixes:
+        start = time.perf_counter()
+        records = trie.query(prefix, args.k)
+        micros = (time.perf_counter() - start) * 1e6
+        print("# {}：{} 条，{:.0f} 微秒".format(prefix, len(records), micros))
+        for record in records:
+            print("\t".join(record))
+        sys.stdout.flush()
+
+
+def args():
+    ap = argparse.ArgumentParser(description="按拼音前缀查询细胞词库中词频最高的词语。")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="由细胞词库构造前缀树并保存。")
+    b.add_argument("scel", nargs="+", help="细胞词库文件。")
+    b.add_argument("--output", "-o", required=True, help="前缀树文件。")
+    b.add_argument("--parser", choices=PARSERS, default="mmap", help="词组表的解析方式，默认 %(default)s。")
+    b.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="重结点预先计算的结果数量，默认 %(default)s。")
+    b.add_argument(
+        "--threshold",
+        type=int,
+        default=DEFAULT_THRESHOLD,
+        help="记录数超过该值的前缀预先计算结果，默认 %(default)s。",
+    )
+    q = sub.add_parser("query", help="查询拼音前缀。")
+    q.add_argument("trie", help="前缀树文件。")
+    q.add_argument("prefix", nargs="*", help="拼音前缀，省略时从标准输入逐行读取。")
+    q.add_argument("-k", type=int, default=DEFAULT_TOP_K, help="返回的结果数量，默认 %(default)s。")
+    return ap.parse_args()
+
+
+if __name__ == "__main__":
+    a = args()
+    if a.command == "build":
+        build(a)
+    else:
+        query(a)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+查看和清理 scel_transfer 的解析缓存。
+
+    python scel_cache.py list
+    python scel_cache.py prune --max-size 256
+    python scel_cache.py clear
+"""
+
+import argparse
+import time
+
+from scel_transfer import DEFAULT_CACHE_DIR, ParseCache
+
+
+def list_entries(cache):
+    entries = cache.entries()
+    total = 0
+    for key, size, last_used, info in reversed(entries):
+        total += size
+        used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used))
+        if "error" in info:
+            print("{}  {:>10}  {}  损坏：{}".format(key, size, used, info["error"]))
+            continue
+        print("{}  {:>10}  {}  {}（{} 个词语）".format(key, size, used, info["title"], info["words"]))
+    print("共 {} 个条目，{:.1f} MB。".format(len(entries), total / (1 << 20)))
+
+
+def args():
+    ap = argparse.ArgumentParser(description="查看和清理细胞词库解析缓存。")
+    ap.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="缓存目录，默认为 %(default)s。")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="按最近使用时间从新到旧列出缓存条目。")
+    prune = sub.add_parser("prune", help="淘汰最久未使用的条目，直到缓存不超过指定大小。")
+    prune.add_argument("--max-size", type=int, required=True, help="缓存的最大容量（MB）。")
+    sub.add_parser("clear", help="删除全部缓存条目。")
+    return ap.parse_args()
+
+
+def main(args):
+    cache = ParseCache(args.cache_dir)
+    if args.command == "list":
+        list_entries(cache)
+    elif args.command == "prune":
+        print("淘汰条目 {} 个。".format(cache.prune(args.max_size * (1 << 20))))
+    elif args.command == "clear":
+        print("删除条目 {} 个。".format(cache.prune(0)))
+
+
+if __name__ == "__main__":
+    main(args())
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+常驻的转写服务，通过本地 Unix socket 接收转写和查询请求，避免每个请求重新启动 scel_transfer.py。
+
+cn_dicts 中每个词典收录的词语、全拼缓存（SPELL_MEMO）和编译后的词典头模板在进程中常驻，
+cn_dicts 中的文件只在大小或修改时间变化后重新读取。
+
+协议：每行一个 JSON 对象（UTF-8），每个请求对应一行 JSON 响应。请求中的 "id" 会原样返回，
+同一个连接上的请求并发处理，响应的顺序不一定与请求一致。文件路径相对于服务进程的工作目录，建议使用绝对路径。
+
+    {"op": "convert", "scel": "/data/foo.scel", "output": "/data/foo.txt",
+     "rime_dir": "/rime", "dict_name": "sogou.foo", "use_ext_as_frequency": true}
+    {"op": "lookup", "rime_dir": "/rime", "words": ["你好", "世界"]}
+    {"op": "stats"}
+
+    python scel_daemon.py --socket /tmp/scel.sock serve --preload /rime
+    python scel_daemon.py --socket /tmp/scel.sock send '{"op": "lookup", "rime_dir": "/rime", "words": ["你好"]}'
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from scel_transfer import (
+    COUNTERS,
+    LOGGER,
+    PARSERS,
+    SPELL_MEMO,
+    InFileDedup,
+    dedup_records,
+    iter_scel,
+    process_rime_dict,
+    read_dict_words,
+    read_header,
+    read_records,
+    simple_logger,
+    write_records,
+)
+
+DEFAULT_SOCKET = "/tmp/scel_transfer.sock"
+# 一行请求的最大长度，lookup 请求可能包含大量词语
+MAX_REQUEST_SIZE = 64 << 20
+
+
+class ResidentWords:
+    """
+    常驻内存的 cn_dicts 词语集合，与 WordIndex 的接口相同，可以直接传给 process_rime_dict。
+
+    每个词典文件的词语连同其大小和修改时间一起保存，refresh 时只重新读取发生变化的文件；
+    另外维护一个词语 -> 收录该词语的文件数 的计数，查询时每个词语只做一次字典查询。
+    """
+
+    def __init__(self) -> None:
+        # 文件名 -> ((大小, 修改时间), 词语集合)
+        self._files = {}
+        self._counts = Counter()
+
+    def __repr__(self) -> str:
+        return "<ResidentWords {} 个文件，{} 个词语>".format(len(self._files), len(self._counts))
+
+    def stats(self):
+        return {"files": len(self._files), "words": len(self._counts)}
+
+    def close(self):
+        pass
+
+    def _remove_file(self, name):
+        _, words = self._files.pop(name)
+        self._counts.subtract(words)
+        for word in words:
+            if self._counts[word] <= 0:
+                del self._counts[word]
+
+    def _put_file(self, name, stat, words):
+        if name in self._files:
+            self._remove_file(name)
+        self._files[name] = ((stat.st_size, stat.st_mtime_ns), words)
+        self._counts.update(words)
+
+    def refresh(self, cn_dicts):
+        names = set(os.listdir(cn_dicts))
+        for name in self._files.keys() - names:
+            LOGGER.info("移除常驻词典：%s", name)
+            self._remove_file(name)
+        for name in sorted(names):
+            stat = os.stat(os.path.join(cn_dicts, name))
+            entry = self._files.get(name)
+            if entry is not None and entry[0] == (stat.st_size, stat.st_mtime_ns):
+                continue
+            LOGGER.info("读取常驻词典：%s", name)
+            self._put_file(name, stat, read_dict_words(os.path.join(cn_dicts, name)))
+
+    def add_file(self, path, words):
+        self._put_file(os.path.basename(path), os.stat(path), set(words))
+
+    def existing(self, words):
+        counts = self._counts
+        return {word for word in words if word in counts}
+
+    def files_of(self, word):
+        """
+        返回收录了 word 的词典文件名。
+        """
+        if word not in self._counts:
+            return []
+        return sorted(name for name, (_, words) in self._files.items() if word in words)
+
+
+class ConversionServer:
+    """
+    处理 JSON 请求的 asyncio 服务。
+
+    解析和写出词典在单个工作线程中依次执行：解析器使用进程内共享的 SPELL_MEMO 和 COUNTERS，
+    不能在多个线程中同时运行。lookup 在另一个线程池中执行，不必排在转写之后；
+    同一个 Rime 目录的请求由一把 asyncio.Lock 串行化，去重总能看到之前写入的词典。
+    """
+
+    def __init__(self, parser="stream", lookup_workers=4) -> None:
+        self.parser = parser
+        self._convert_executor = ThreadPoolExecutor(1, thread_name_prefix="convert")
+        self._lookup_executor = ThreadPoolExecutor(lookup_workers, thread_name_prefix="lookup")
+        # Rime 目录的绝对路径 -> (asyncio.Lock, ResidentWords)
+        self._rime_dirs = {}
+        self.requests = Counter()
+        self.started = time.time()
+
+    def rime_dir(self, path):
+        path = os.path.abspath(path)
+        entry = self._rime_dirs.get(path)
+        if entry is None:
+            entry = self._rime_dirs[path] = (asyncio.Lock(), ResidentWords())
+        return entry
+
+    async def preload(self, rime_dir):
+        lock, words = self.rime_dir(rime_dir)
+        async with lock:
+            await self._run(self._lookup_executor, self._refresh, rime_dir, words)
+        LOGGER.info("预加载 %s：%r", rime_dir, words)
+
+    @staticmethod
+    async def _run(executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    @staticmethod
+    def _refresh(rime_dir, words):
+        cn_dicts = os.path.join(rime_dir, "cn_dicts")
+        os.makedirs(cn_dicts, exist_ok=True)
+        words.refresh(cn_dicts)
+
+    def _parse(self, request):
+        meta, records = iter_scel(request["scel"], bool(request.get("use_ext_as_frequency")), self.parser)
+        records = read_records(records)
+        if request.get("dedup"):
+            records = dedup_records(InFileDedup(request["dedup"], request.get("dedup_keep", "first")), records)
+        if request.get("output"):
+            write_records(request["output"], records)
+        return meta, records
+
+    @staticmethod
+    def _write_rime_dict(request, records, words):
+        header = read_header(request["scel"], request["dict_name"], request.get("header"))
+        return process_rime_dict(request["dict_name"], request["rime_dir"], records, header, words)
+
+    async def convert(self, request):
+        if "scel" not in request:
+            raise ValueError("缺少 'scel'。")
+        if request.get("rime_dir") and not request.get("dict_name"):
+            raise ValueError("当 'rime_dir' 不为空时，'dict_name' 不可为空。")
+        if request.get("dedup_keep") == "max-freq" and not request.get("use_ext_as_frequency"):
+            raise ValueError("'dedup_keep' 为 max-freq 时需要 'use_ext_as_frequency'。")
+        meta, records = await self._run(self._convert_executor, self._parse, request)
+        response = {"title": meta.title, "words": len(records)}
+        if request.get("rime_dir"):
+            lock, words = self.rime_dir(request["rime_dir"])
+            async with lock:
+                response["new_words"] = await self._run(
+                    self._convert_executor, self._write_rime_dict, request, records, words
+                )
+        return response
+
+    def _lookup(self, rime_dir, words, queried):
+        self._refresh(rime_dir, words)
+        return {word: words.files_of(word) for word in words.existing(queried)}
+
+    async def lookup(self, request):
+        if not request.get("rime_dir") or not isinstance(request.get("words"), list):
+            raise ValueError("lookup 请求需要 'rime_dir' 和 'words'（列表）。")
+        lock, words = self.rime_dir(request["rime_dir"])
+        async with lock:
+            found = await self._run(self._lookup_executor, self._lookup, request["rime_dir"], words, request["words"])
+        return {"found": found, "missing": [word for word in request["words"] if word not in found]}
+
+    async def stats(self, request):
+        return {
+            "uptime": time.time() - self.started,
+            "requests": dict(self.requests),
+            "counters": dict(COUNTERS),
+            "spell_memo": {"hits": SPELL_MEMO.hits, "misses": SPELL_MEMO.misses, "entries": len(SPELL_MEMO)},
+            "rime_dirs": {path: words.stats() for path, (_, words) in self._rime_dirs.items()},
+        }
+
+    HANDLERS = {"convert": convert, "lookup": lookup, "stats": stats}
+
+    async def handle(self, line):
+        """
+        处理一行请求，返回响应对象。请求本身的错误（格式、参数、文件不存在等）返回 "ok": false；
+        其他异常（例如损坏的细胞词库引发的 struct.error）同样返回 "ok": false 并记录堆栈，每个请求都有响应。
+        """
+        start = time.perf_counter()
+        request, op = {}, "invalid"
+        try:
+            parsed = json.loads(line)
+            if not isinstance(parsed, dict):
+                raise ValueError("请求必须是 JSON 对象。")
+            request = parsed
+            handler = self.HANDLERS.get(request.get("op"))
+            if handler is None:
+                raise ValueError("未知的请求类型：{}".format(request.get("op")))
+            op = request["op"]
+            response = await handler(self, request)
+            response["ok"] = True
+        except (OSError, ValueError, KeyError, TypeError, UnicodeDecodeError) as e:
+            LOGGER.error("请求失败：%s，%r", op, e)
+            response = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+        except Exception as e:
+            LOGGER.exception("请求异常：%s", op)
+            response = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+        self.requests[op] += 1
+        if "id" in request:
+            response["id"] = request["id"]
+        response["seconds"] = time.perf_counter() - start
+        LOGGER.debug("请求 %s 耗时 %.3f 秒。", op, response["seconds"])
+        return response
+
+    async def _respond(self, line, writer):
+        response = await self.handle(line)
+        writer.write(json.dumps(response, ensure_ascii=False).encode("utf8") + b"\n")
+        await writer.drain()
+
+    async def connected(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError) as e:
+            # ValueError：一行超过 MAX_REQUEST_SIZE
+            LOGGER.warning("连接异常断开：%r", e)
+        finally:
+            writer.close()
+
+    def close(self):
+        self._convert_executor.shutdown()
+        self._lookup_executor.shutdown()
+
+
+def _remove_stale_socket(path):
+    """
+    删除之前的服务进程遗留的 socket 文件。另一个服务仍在运行时抛出 ValueError。
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            LOGGER.info("删除遗留的 socket 文件：%s", path)
+            os.unlink(path)
+            return
+    raise ValueError("服务已经在运行：{}".format(path))
+
+
+async def serve(args):
+    server = ConversionServer(args.parser, args.lookup_workers)
+    _remove_stale_socket(args.socket)
+    listener = await asyncio.start_unix_server(server.connected, args.socket, limit=MAX_REQUEST_SIZE)
+    os.chmod(args.socket, args.socket_mode)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        for rime_dir in args.preload:
+            await server.preload(rime_dir)
+        LOGGER.info("监听：%s", args.socket)
+        await stop.wait()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        os.unlink(args.socket)
+        server.close()
+        LOGGER.info("服务停止，共处理请求 %d 个，全拼缓存：%s", sum(server.requests.values()), SPELL_MEMO)
+
+
+def request(path, payload):
+    """
+    发送一个请求并等待响应，供其它 Python 工具同步调用。
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as fp:
+            return json.loads(fp.readline())
+
+
+def send(args):
+    lines = args.request or (line for line in sys.stdin if line.strip())
+    ok = True
+    for line in lines:
+        response = request(args.socket, json.loads(line))
+        ok = ok and response["ok"]
+        print(json.dumps(response, ensure_ascii=False))
+    if not ok:
+        sys.exit(1)
+
+
+def args():
+    ap = argparse.ArgumentParser(description="常驻的细胞词库转写服务。")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket 路径，默认 %(default)s。")
+    sub = ap.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("serve", help="启动服务，收到 SIGINT 或 SIGTERM 时退出。")
+    s.add_argument("--parser", choices=PARSERS, default="stream", help="词组表的解析方式，默认 %(default)s。")
+    s.add_argument("--preload", nargs="*", default=[], metavar="RIME_DIR", help="启动时预先读取的 Rime 用户文件夹。")
+    s.add_argument("--lookup-workers", type=int, default=4, help="处理 lookup 请求的线程数，默认 %(default)s。")
+    s.add_argument(
+        "--socket-mode",
+        type=lambda x: int(x, 8),
+        default=0o600,
+        help="socket 文件的权限（八进制），默认只有服务进程的用户可以连接。",
+    )
+    c = sub.add_parser("send", help="发送请求并输出响应，任一请求失败时以非零状态退出。")
+    c.add_argument("request", nargs="*", help="JSON 请求，省略时从标准输入逐行读取。")
+    return ap.parse_args()
+
+
+if __name__ == "__main__":
+    a = args()
+    if a.command == "serve":
+        simple_logger()
+        asyncio.run(serve(a))
+    else:
+        send(a)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+细胞词库的旁路块索引，用于不完整解析词库即可查询某个词语或全拼对应的记录。
+
+索引保存在词库旁边的 <词库文件名>.idx 中，包含每个同音词块的偏移以及词语、全拼的哈希，
+查询时通过二分查找定位同音词块，只解码命中的块。词库文件的大小或修改时间变化后索引自动失效。
+
+    python scel_index.py build foo.scel
+    python scel_index.py word foo.scel 你好
+    python scel_index.py pinyin foo.scel "ni hao"
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from scel_transfer import LOGGER, get_hz_offset, iter_word_table_mmap, scan_blocks, syllable_table
+
+INDEX_SUFFIX = ".idx"
+
+
+def key_hash(text):
+    """
+    稳定的 32 位哈希（与进程无关），用于在索引中定位词语和全拼，命中后再解码同音词块比对原文。
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=4).digest(), "little")
+
+
+def _packed(hashes_and_blocks):
+    """
+    把 (哈希, 块编号) 打包为 (哈希 << 32 | 块编号) 并排序，二分查找时可以一次取出一个哈希对应的所有块。
+    """
+    return array("Q", sorted(h << 32 | block for h, block in hashes_and_blocks))
+
+
+def _padded(data):
+    # 每一节都按 8 字节对齐，加载时可以直接把映射的内存转换为 uint64 数组
+    return data + bytes(-len(data) % 8)
+
+
+class BlockIndex:
+    """
+    文件格式（字节序与生成索引的机器相同，记录在头部，不一致时视为失效）：
+    - 8 字节：魔数 MAGIC
+    - HEADER：字节序、源文件大小、源文件修改时间、汉语词组表偏移、同音词块数量、词语数量
+    - uint64 数组：每个同音词块的起始偏移，最后一项为词组表的结束位置
+    - uint64 数组：排序后的 (词语哈希 << 32 | 块编号)
+    - uint64 数组：排序后的 (全拼哈希 << 32 | 块编号)
+    """
+
+    MAGIC = b"SCELIDX\x01"
+    HEADER = struct.Struct("=8sQqQQQ")
+
+    def __init__(self, scel, data) -> None:
+        self.scel = scel
+        self._data = data
+        _, _, _, self.hz_offset, self.block_cnt, self.word_cnt = self.HEADER.unpack_from(data, len(self.MAGIC))
+        pos = len(self.MAGIC) + self.HEADER.size
+        pos += -pos % 8
+        sections = []
+        for length in (self.block_cnt + 1, self.word_cnt, self.block_cnt):
+            sections.append(memoryview(data)[pos : pos + 8 * length].cast("Q"))
+            pos += 8 * length
+        self.offsets, self.words, self.spells = sections
+        self._syllables = None
+
+    @staticmethod
+    def path(scel):
+        return scel + INDEX_SUFFIX
+
+    @classmethod
+    def _source_key(cls, scel):
+        stat = os.stat(scel)
+        return sys.byteorder.encode("ascii").ljust(8, b"\0"), stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def build(cls, scel):
+        """
+        解析一遍词库，写出索引文件并返回加载后的索引。
+        """
+        source_key = cls._source_key(scel)
+        words, spells = [], []
+        with open(scel, "rb") as fp:
+            hz_offset = get_hz_offset(fp)
+            py_map = syllable_table(fp)
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                end = len(buf)
+                offsets = scan_blocks(buf, hz_offset, end)
+                offsets.append(end)
+                # 一次解析整个词组表，按每个块头部的同音词数量把记录归入各个块
+                records = iter_word_table_mmap(buf, hz_offset, py_map, False, end=end)
+                try:
+                    for block in range(len(offsets) - 1):
+                        word_cnt = struct.unpack_from("<H", buf, offsets[block])[0]
+                        for i, (word, full_spell) in zip(range(word_cnt), records):
+                            if i == 0:
+                                spells.append((key_hash(full_spell), block))
+                            words.append((key_hash(word), block))
+                finally:
+                    records.close()
+
+        path = cls.path(scel)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as ofp:
+            header = cls.HEADER.pack(*source_key, hz_offset, len(offsets) - 1, len(words))
+            ofp.write(_padded(cls.MAGIC + header))
+            ofp.write(offsets.tobytes())
+            ofp.write(_packed(words).tobytes())
+            ofp.write(_packed(spells).tobytes())
+        os.replace(tmp, path)
+        LOGGER.info("写入块索引：%s，同音词块 %d 个，词语 %d 个。", path, len(offsets) - 1, len(words))
+        return cls.load(scel)
+
+    @classmethod
+    def load(cls, scel):
+        """
+        加载索引。索引不存在、格式不符或词库文件已变化时返回 None。
+        """
+        path = cls.path(scel)
+        try:
+            with open(path, "rb") as fp:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data[: len(cls.MAGIC)] != cls.MAGIC or len(data) < len(cls.MAGIC) + cls.HEADER.size:
+            data.close()
+            return None
+        if cls.HEADER.unpack_from(data, len(cls.MAGIC))[:3] != cls._source_key(scel):
+            LOGGER.info("词库文件已变化，块索引失效：%s", path)
+            data.close()
+            return None
+        return cls(scel, data)
+
+    @classmethod
+    def open(cls, scel):
+        """
+        加载索引，索引不可用时重新生成。
+        """
+        return cls.load(scel) or cls.build(scel)
+
+    def close(self):
+        for section in (self.offsets, self.words, self.spells):
+            section.release()
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _blocks(packed, text):
+        h = key_hash(text)
+        lo = bisect_left(packed, h << 32)
+        hi = bisect_right(packed, h << 32 | 0xFFFFFFFF, lo)
+        return sorted({packed[i] & 0xFFFFFFFF for i in range(lo, hi)})
+
+    def _records(self, blocks, use_ext_as_frequency):
+        with open(self.scel, "rb") as fp:
+            if self._syllables is None:
+                self._syllables = syllable_table(fp)
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for block in blocks:
+                    start, end = self.offsets[block], self.offsets[block + 1]
+                    yield from iter_word_table_mmap(buf, start, self._syllables, use_ext_as_frequency, end=end)
+
+    def lookup_word(self, word, use_ext_as_frequency=False):
+        """
+        返回词库中词语为 word 的所有记录。
+        """
+        blocks = self._blocks(self.words, word)
+        return [record for record in self._records(blocks, use_ext_as_frequency) if record[0] == word]
+
+    def lookup_pinyin(self, full_spell, use_ext_as_frequency=False):
+        """
+        返回词库中全拼为 full_spell（音节以空格分隔）的所有记录。
+        """
+        blocks = self._blocks(self.spells, full_spell)
+        return [record for record in self._records(blocks, use_ext_as_frequency) if record[1] == full_spell]
+
+
+def args():
+    ap = argparse.ArgumentParser(description="细胞词库的块索引，按词语或全拼查询记录。")
+    ap.add_argument("--use-ext-as-frequency", action="store_true", default=False, help="输出词频。")
+    sub = ap.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="生成（或重新生成）块索引。")
+    build.add_argument("scel", help="细胞词库文件。")
+    word = sub.add_parser("word", help="查询词语对应的全拼。")
+    word.add_argument("scel", help="细胞词库文件。")
+    word.add_argument("word", help="词语。")
+    pinyin = sub.add_parser("pinyin", help="查询全拼对应的词语。")
+    pinyin.add_argument("scel", help="细胞词库文件。")
+    pinyin.add_argument("pinyin", help="全拼，音节以空格分隔，例如 'ni hao'。")
+    return ap.parse_args()
+
+
+def main(args):
+    if args.command == "build":
+        BlockIndex.build(args.scel).close()
+        return
+    with BlockIndex.open(args.scel) as index:
+        if args.command == "word":
+            records = index.lookup_word(args.word, args.use_ext_as_frequency)
+        else:
+            records = index.lookup_pinyin(args.pinyin, args.use_ext_as_frequency)
+    for record in records:
+        print("\t".join(record))
+    if not records:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(args())
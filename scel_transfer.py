@@ -1,36 +1,420 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager, nullcontext
 from io import BufferedReader
+import bisect
+import glob
+import hashlib
+import itertools
+import json
 import logging
+import mmap
+import operator
 import os
+import re
+import sqlite3
 import struct
+import sys
+import time
+import zlib
 import argparse
 
 
-def simple_logger():
+# 比 DEBUG 更详细的跟踪级别，用于输出解析过程中每个字段、每条记录的诊断信息。
+# 解析的热点路径只在该级别开启时才会调用日志，默认不产生任何日志开销。
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+
+# 导入模块时不配置任何 handler，作为库使用时日志由调用方决定；命令行入口调用 simple_logger() 初始化
+LOGGER = logging.getLogger("scel_transfer")
+LOGGER.addHandler(logging.NullHandler())
+
+# simple_logger() 使用的日志文件，None 表示尚未初始化
+_LOG_FILE = None
+
+
+def simple_logger(level=None, log_file="py.log"):
+    """
+    初始化日志：输出到控制台和 log_file。level 默认从环境变量 PY_LOG_LEVEL 读取。
+    重复调用只会更新日志级别，不会重复添加 handler。
+    """
+    global _LOG_FILE
+
     def _log_level_from_env():
         return os.environ.get("PY_LOG_LEVEL", logging.INFO)
 
-    lvl = _log_level_from_env()
-    logger = logging.getLogger(__file__)
-    logger.setLevel(lvl)
-    handler = logging.FileHandler(filename="py.log", encoding="utf8")
+    lvl = level if level is not None else _log_level_from_env()
+    LOGGER.setLevel(lvl)
+    if _LOG_FILE is not None:
+        return LOGGER
+    handler = logging.FileHandler(filename=log_file, encoding="utf8")
     formatter = logging.Formatter("%(asctime)s %(levelname)-7s %(filename)12s:%(lineno)-3d %(message)s")
     handler.setFormatter(formatter)
     console = logging.StreamHandler()
     console.setFormatter(formatter)
     console.setLevel(logging.INFO)
-    logger.addHandler(handler)
-    logger.addHandler(console)
-    return logger
-
-
-LOGGER = simple_logger()
+    LOGGER.addHandler(handler)
+    LOGGER.addHandler(console)
+    _LOG_FILE = log_file
+    return LOGGER
 
 PH_SOURCE_FILE = "__source_file__"
 PH_DICT_NAME = "__dict_name__"
 
-HEADER_YAML = os.path.join(os.path.curdir, "header.yaml")
+# 默认的词典头模板，与本模块放在同一目录下，不依赖当前工作目录
+HEADER_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "header.yaml")
+
+# 进程内的计数器，记录各阶段的工作量，例如去重时比较的词语数量
+COUNTERS = Counter()
+
+# 转写流程的各个阶段，--profile 按此顺序输出
+PROFILE_STAGES = (
+    "get_hz_offset",
+    "get_dict_meta",
+    "syllable_table",
+    "word_table",
+    "dedup",
+    "unique_words",
+    "writeout",
+)
+
+
+class StageProfile:
+    """
+    记录每个阶段的墙钟时间、CPU 时间（仅当前进程）、读写字节数和记录数，同一阶段多次执行时累加。
+    同时按 DURATION_BUCKETS 统计每次执行耗时的直方图，以及各阶段中按异常类型统计的失败次数，
+    用于导出 Prometheus 指标。直方图只保存每个桶的次数，长时间运行时占用的内存不会增长。
+
+    hot_stage 不为 None 时，使用 cProfile 剖析该阶段，结果由 write 一并写出。
+    trace 为 True 时把每个阶段和 span 记录为 Chrome trace 事件，由 write_trace 写出；
+    max_events 不为 None 时只保留最近的 max_events 个事件。
+    block_group 大于 0 时，解析词组表时每 block_group 个同音词块记录一个 span。
+    """
+
+    def __init__(self, hot_stage=None, trace=False, block_group=0, max_events=None) -> None:
+        self.stages = {}
+        # 阶段 -> 各桶的次数，最后一个桶为超过最大上界的次数
+        self.durations = {}
+        self.failures = Counter()
+        self.events = deque(maxlen=max_events) if trace else None
+        self.block_group = block_group if trace else 0
+        self.hot_stage = hot_stage
+        self.pid = os.getpid()
+        self._cprofile = None
+        self._last_failure = None
+        self._start = time.perf_counter()
+
+    def clone(self):
+        """
+        返回选项相同的空白 StageProfile，供工作进程使用。工作进程不做 cProfile 剖析。
+        """
+        max_events = self.events.maxlen if self.events is not None else None
+        return StageProfile(trace=self.events is not None, block_group=self.block_group, max_events=max_events)
+
+    def _stats(self, name):
+        return self.stages.setdefault(name, Counter())
+
+    @contextmanager
+    def span(self, name, category="span", /, **args):
+        """
+        记录一个 Chrome trace 的完整事件（ph 为 X）。时间戳取自 time.perf_counter，
+        在 Linux 上是各进程共享的单调时钟，所以工作进程的事件与主进程在同一条时间轴上。
+        name 和 category 只能按位置传入，args 中可以使用任意的参数名（例如 start）。
+        """
+        if self.events is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, category, **args)
+
+    def add_span(self, name, start, category="span", /, **args):
+        """
+        记录一个从 start（time.perf_counter 的返回值）到现在的完整事件，用于无法用 with 包围的区间。
+        """
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (time.perf_counter() - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def stage(self, name):
+        """
+        计时一个阶段，产出该阶段的计数器，调用方在其中累加 bytes_read、bytes_written 和 records。
+        """
+        stats = self._stats(name)
+        hot = name == self.hot_stage
+        if hot and self._cprofile is None:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if hot:
+            self._cprofile.enable()
+        try:
+            with self.span(name, "stage"):
+                yield stats
+        except Exception as e:
+            self.failed(name, e)
+            raise
+        finally:
+            if hot:
+                self._cprofile.disable()
+            seconds = time.perf_counter() - wall
+            stats["calls"] += 1
+            stats["wall_seconds"] += seconds
+            stats["cpu_seconds"] += time.process_time() - cpu
+            self._buckets(name)[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+
+    def _buckets(self, name):
+        return self.durations.setdefault(name, [0] * (len(DURATION_BUCKETS) + 1))
+
+    def count(self, name, **amounts):
+        self._stats(name).update(amounts)
+
+    def failed(self, name, exc):
+        """
+        记录阶段 name 中发生的异常。同一个异常向外传播经过多个阶段时只记录在最内层的阶段。
+        """
+        if exc is self._last_failure:
+            return
+        self._last_failure = exc
+        self.failures[name, type(exc).__name__] += 1
+
+    def merge(self, other):
+        """
+        合并工作进程中记录的 StageProfile。
+        """
+        for name, stats in other.stages.items():
+            self._stats(name).update(stats)
+        for name, counts in other.durations.items():
+            self.durations[name] = list(map(operator.add, self._buckets(name), counts))
+        self.failures.update(other.failures)
+        if self.events is not None and other.events:
+            self.events.extend(other.events)
+
+    def __getstate__(self):
+        # 工作进程返回结果时不传输 cProfile 和异常对象
+        state = self.__dict__.copy()
+        state["_cprofile"] = state["_last_failure"] = None
+        return state
+
+    def report(self):
+        order = list(PROFILE_STAGES) + sorted(self.stages.keys() - set(PROFILE_STAGES))
+        stages = {}
+        for name in order:
+            if name not in self.stages:
+                continue
+            stats = self.stages[name]
+            fields = ("calls", "wall_seconds", "cpu_seconds", "records", "bytes_read", "bytes_written")
+            report = {field: stats[field] for field in fields}
+            wall, nbytes = stats["wall_seconds"], stats["bytes_read"] + stats["bytes_written"]
+            report["records_per_second"] = stats["records"] / wall if wall else None
+            report["mb_per_second"] = nbytes / wall / (1 << 20) if wall else None
+            stages[name] = report
+        return {
+            "wall_seconds": time.perf_counter() - self._start,
+            "cpu_seconds": time.process_time(),
+            "stages": stages,
+            "failures": [
+                {"stage": stage, "type": exc_type, "count": count}
+                for (stage, exc_type), count in sorted(self.failures.items())
+            ],
+            "counters": dict(COUNTERS),
+        }
+
+    def write(self, path, dump_path=None):
+        """
+        写出 JSON 报告，path 为 "-" 时写到标准输出。指定 dump_path 时写出热点阶段的 cProfile 结果。
+        """
+        report = json.dumps(self.report(), ensure_ascii=False, indent=2)
+        if path == "-":
+            print(report)
+        else:
+            with open(path, "w", encoding="utf8") as ofp:
+                ofp.write(report)
+        if dump_path and self._cprofile is not None:
+            self._cprofile.dump_stats(dump_path)
+
+    def write_trace(self, path):
+        """
+        写出 Chrome trace-event 格式的 JSON，可以用 Perfetto 或 chrome://tracing 打开。
+        """
+        pids = sorted({event["pid"] for event in self.events})
+        names = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "scel_transfer" if pid == self.pid else "worker {}".format(pid)},
+            }
+            for pid in pids
+        ]
+        with open(path, "w", encoding="utf8") as ofp:
+            json.dump({"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}, ofp, ensure_ascii=False)
+
+
+# 开启 --profile 时为 StageProfile，否则为 None
+PROFILE = None
+
+
+def profile_stage(name):
+    """
+    在 PROFILE 中计时一个阶段；未开启时不计时，产出一个不会被使用的计数器。
+    """
+    if PROFILE is None:
+        return nullcontext(Counter())
+    return PROFILE.stage(name)
+
+
+def profile_span(name, /, **args):
+    """
+    开启 --chrome-trace 时记录一个 span，否则什么也不做。
+    """
+    if PROFILE is None:
+        return nullcontext()
+    return PROFILE.span(name, **args)
+
+
+class BlockGroupSpans:
+    """
+    解析词组表时每 group 个同音词块记录一个 "blocks" span，见 StageProfile.block_group。
+    解析函数在每个同音词块开始时调用 block，解析结束时调用 close，各组的 span 在同一个解析循环中产生。
+    """
+
+    def __init__(self, profile, group) -> None:
+        self.profile = profile
+        self.group = group
+        self.blocks = 0
+        self._first = self._start = self._pos = None
+
+    def block(self, pos):
+        if self.blocks % self.group == 0:
+            self.close(pos)
+            self._first, self._start, self._pos = self.blocks, time.perf_counter(), pos
+        self.blocks += 1
+
+    def close(self, pos):
+        if self._start is None:
+            return
+        blocks = self.blocks - self._first
+        self.profile.add_span("blocks", self._start, first_block=self._first, blocks=blocks, bytes=pos - self._pos)
+        self._start = None
+
+
+def block_group_spans(block_group):
+    """
+    block_group 大于 0 且开启了 --chrome-trace 时返回 BlockGroupSpans，否则返回 None。
+    """
+    if block_group <= 0 or PROFILE is None or PROFILE.events is None:
+        return None
+    return BlockGroupSpans(PROFILE, block_group)
+
+
+METRICS_PREFIX = "scel_transfer_"
+# 阶段耗时直方图的桶上界（秒）
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+def _metric_labels(labels):
+    if not labels:
+        return ""
+    values = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join('{}="{}"'.format(k, v) for k, v in zip(labels, values)) + "}"
+
+
+def prometheus_metrics(profile, success):
+    """
+    把 StageProfile 和 COUNTERS 转换为 Prometheus 文本格式。
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP {}{} {}".format(METRICS_PREFIX, name, help_text))
+        lines.append("# TYPE {}{} {}".format(METRICS_PREFIX, name, kind))
+        for suffix, labels, value in samples:
+            lines.append("{}{}{}{} {}".format(METRICS_PREFIX, name, suffix, _metric_labels(labels), value))
+
+    stages = profile.stages
+    word_table = stages.get("word_table", Counter())
+    metric("words_parsed_total", "counter", "Words parsed from .scel word tables.", [("", {}, word_table["records"])])
+    metric(
+        "words_deduplicated_total",
+        "counter",
+        "Words dropped by unique_words() because cn_dicts already contains them.",
+        [("", {}, COUNTERS["dedup_duplicates"])],
+    )
+    metric(
+        "words_dedup_checked_total",
+        "counter",
+        "Words checked by unique_words().",
+        [("", {}, COUNTERS["dedup_records_checked"])],
+    )
+    metric("files_parsed_total", "counter", "Word tables parsed.", [("", {}, word_table["calls"])])
+    for field, help_text in (
+        ("bytes_read", "Bytes read per stage."),
+        ("bytes_written", "Bytes written per stage."),
+        ("records", "Records processed per stage."),
+        ("cpu_seconds", "CPU seconds spent per stage."),
+    ):
+        samples = [("", {"stage": name}, stats[field]) for name, stats in stages.items() if stats[field]]
+        metric("stage_{}_total".format(field), "counter", help_text, samples)
+
+    samples = []
+    for name, counts in profile.durations.items():
+        cumulative = list(itertools.accumulate(counts))
+        for bound, count in zip(DURATION_BUCKETS, cumulative):
+            samples.append(("_bucket", {"stage": name, "le": bound}, count))
+        samples.append(("_bucket", {"stage": name, "le": "+Inf"}, cumulative[-1]))
+        samples.append(("_sum", {"stage": name}, stages[name]["wall_seconds"]))
+        samples.append(("_count", {"stage": name}, cumulative[-1]))
+    metric("stage_duration_seconds", "histogram", "Wall time per stage execution.", samples)
+
+    samples = [("", {"stage": stage, "type": exc_type}, n) for (stage, exc_type), n in sorted(profile.failures.items())]
+    metric("failures_total", "counter", "Failures by stage and exception type.", samples)
+    metric(
+        "run_duration_seconds",
+        "gauge",
+        "Wall time of the last run.",
+        [("", {}, time.perf_counter() - profile._start)],
+    )
+    metric("last_run_success", "gauge", "1 if the last run had no failures.", [("", {}, int(success))])
+    metric("last_run_timestamp_seconds", "gauge", "Unix time the last run finished.", [("", {}, time.time())])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, profile, success):
+    """
+    写出 Prometheus textfile collector 使用的指标文件。先写临时文件再替换，collector 不会读到写了一半的文件。
+    """
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w", encoding="utf8", newline="\n") as ofp:
+        ofp.write(prometheus_metrics(profile, success))
+    os.replace(tmp, path)
+
+
+_UINT16 = struct.Struct("<H")
+_BLOCK_HEAD = struct.Struct("<HH")
+
+
+def tracing():
+    """
+    是否开启了跟踪级别的日志。热点循环在开始前调用一次，据此选择是否带日志的实现。
+    """
+    return LOGGER.isEnabledFor(TRACE)
 
 
 def read_utf16_str(f: BufferedReader, offset=-1, size=2):
@@ -39,22 +423,45 @@ def read_utf16_str(f: BufferedReader, offset=-1, size=2):
     string = f.read(size)
     s = string.decode("UTF-16LE")
     s = s.rstrip("\0")  # string may have trailing '\0'
-    LOGGER.debug("解析字符串，起始位置：%d，字符串长度：%d，字符串：%s", offset, size, s)
     return s
 
 
 def read_uint16(f):
-    v = struct.unpack("<H", f.read(2))
-    LOGGER.debug("读取小端uint16：%d", v[0])
-    return v[0]
+    return _UINT16.unpack(f.read(2))[0]
+
+
+def trace_read_utf16_str(f: BufferedReader, offset=-1, size=2):
+    s = read_utf16_str(f, offset, size)
+    LOGGER.log(TRACE, "解析字符串，起始位置：%d，字符串长度：%d，字符串：%s", offset, size, s)
+    return s
+
+
+def trace_read_uint16(f):
+    v = read_uint16(f)
+    LOGGER.log(TRACE, "读取小端uint16：%d", v)
+    return v
+
+
+def field_readers():
+    """
+    返回 (read_uint16, read_utf16_str)，开启跟踪时返回带日志的版本。
+    """
+    if tracing():
+        return trace_read_uint16, trace_read_utf16_str
+    return read_uint16, read_utf16_str
+
+
+# 文件头第 5 个字节（mask）与汉语词组表偏移量的对应关系
+HZ_OFFSETS = {0x44: 0x2628, 0x45: 0x26C4}
 
 
 def get_hz_offset(f):
-    mask = f.read(128)[4]
-    if mask == 0x44:
-        return 0x2628
-    elif mask == 0x45:
-        return 0x26C4
+    head = f.read(128)
+    if len(head) < 5:
+        raise ValueError("file is too short: {} bytes".format(len(head)))
+    mask = head[4]
+    if mask in HZ_OFFSETS:
+        return HZ_OFFSETS[mask]
     else:
         LOGGER.error("不支持的文件类型(无法获取汉语词组的偏移量)")
         raise ValueError("unknown mask: {}".format(mask))
@@ -100,16 +507,20 @@ def syllable_table(f):
     - length 字节: 当前的拼音，每个字符两个字节
     """
     syllables = {}
+    read_u16, read_str = field_readers()
+    trace = tracing()
     f.seek(0x1540 + 4)
     cnt = 0
     while True:
-        index = read_uint16(f)
-        length = read_uint16(f)
-        syllable = read_utf16_str(f, -1, length)
+        index = read_u16(f)
+        length = read_u16(f)
+        syllable = read_str(f, -1, length)
         # 按顺序排列的音节，其索引必然等于计数器
-        assert index == cnt
+        if index != cnt:
+            raise ValueError("音节表损坏：第 {} 个音节的索引为 {}".format(cnt, index))
         syllables[index] = syllable
-        LOGGER.debug("索引值：%2d -> %s", index, syllable)
+        if trace:
+            LOGGER.log(TRACE, "索引值：%2d -> %s", index, syllable)
 
         cnt += 1
         if syllable == "zuo":
@@ -119,7 +530,73 @@ def syllable_table(f):
     return syllables
 
 
+class SpellMemo:
+    """
+    同音词块全拼的有界缓存：音节索引（原始字节）-> 驻留（interned）的全拼字符串。
+
+    相同的音节索引序列在一个词库的多个同音词块、以及同一进程转写的多个词库之间大量重复，
+    缓存后不必每次重新拼接，所有记录共享同一个全拼字符串对象。
+    每种音节表各自缓存，一种音节表的条目数达到 maxsize 时淘汰其中最早加入的条目；maxsize 为 0 时不缓存。
+    """
+
+    def __init__(self, maxsize=1 << 16) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tables = {}
+
+    def table(self, syllable_table):
+        """
+        返回 syllable_table 对应的缓存字典，内容相同的音节表共享同一个字典。
+        """
+        key = tuple(sorted(syllable_table.items()))
+        return self._tables.setdefault(key, OrderedDict())
+
+    def add(self, spells, raw, full_spell):
+        full_spell = sys.intern(full_spell)
+        if self.maxsize <= 0:
+            return full_spell
+        if len(spells) >= self.maxsize:
+            spells.popitem(last=False)
+        spells[raw] = full_spell
+        return full_spell
+
+    def record(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+
+    def __len__(self):
+        return sum(len(spells) for spells in self._tables.values())
+
+    def __repr__(self) -> str:
+        return "命中 {}，未命中 {}，条目 {}".format(self.hits, self.misses, len(self))
+
+
+# 进程内共享的全拼缓存，可以通过 --spell-memo-size 调整大小
+SPELL_MEMO = SpellMemo()
+
+
+def decode_full_spell(raw, syllable_table):
+    """
+    把同音词块中的音节索引（原始字节，每个索引 2 字节）解码为以空格分隔的全拼。
+    """
+    indices = array("H", raw)
+    if sys.byteorder == "big":
+        indices.byteswap()
+    try:
+        return " ".join(map(syllable_table.__getitem__, indices))
+    except KeyError as e:
+        raise ValueError("发现了未注册的拼音索引：{}".format(e.args[0])) from None
+
+
 def word_table(f: BufferedReader, file_size, hz_offset, syllable_table, use_ext_as_frequency):
+    """
+    读取完整的汉语词组表，格式见 iter_word_table。
+    """
+    return list(iter_word_table(f, file_size, hz_offset, syllable_table, use_ext_as_frequency))
+
+
+def iter_word_table(f: BufferedReader, file_size, hz_offset, syllable_table, use_ext_as_frequency, block_group=0):
     """
     汉语词组表，在文件中的偏移值是 0x2628 或 0x26c4
     格式为多个同音词块，一个同音词块的格式如下：
@@ -135,44 +612,173 @@ def word_table(f: BufferedReader, file_size, hz_offset, syllable_table, use_ext_
         - (ext_len bytes ): ext     : 扩展信息，一共 10 个字节，前两个字节是一个整数（不知道是不是词频），
                                           后八个字节全是 0，ext_len 和 ext 一共 12 个字节
 
+    每解析出一个词语即产出一条记录，不在内存中保留整张词组表。
+    全拼通过 SPELL_MEMO 缓存；开启跟踪时逐个读取并记录音节索引，不使用缓存。
+    block_group 大于 0 时每 block_group 个同音词块记录一个 span，见 BlockGroupSpans。
     """
+    read_u16, read_str = field_readers()
+    trace = tracing()
+    spells = SPELL_MEMO.table(syllable_table)
+    groups = block_group_spans(block_group)
+    blocks = misses = 0
     f.seek(hz_offset)
-    words = []
-    while f.tell() != file_size:
-        word_cnt = read_uint16(f)
-        syllable_cnt = read_uint16(f)
-        LOGGER.debug("同音词数量：%d，音节索引数量：%d", word_cnt, syllable_cnt)
-        syllables = []
-        for _ in range(syllable_cnt // 2):  # read_uint16 每次读取 2 byte，所以需要除以 2
-            syllable_index = read_uint16(f)
-            if syllable_index not in syllable_table:
-                raise ValueError("发现了未注册的拼音索引：{}".format(syllable_index))
-            syllables.append(syllable_table[syllable_index])
-        full_spell = " ".join(syllables)
-        LOGGER.debug("获得全拼：%s", full_spell)
-
-        for _ in range(word_cnt):
-            char_cnt = read_uint16(f)
-            word = read_utf16_str(f, -1, char_cnt)
-            LOGGER.debug("获得词语：%s，长度：%d", word, char_cnt)
-
-            # ext_len 和 ext 共 12 个字节
-            if use_ext_as_frequency:
-                f.read(2)
-                freq = read_uint16(f)
-                f.read(8)
-                words.append((word, full_spell, str(freq)))
+    try:
+        while f.tell() != file_size:
+            if groups is not None:
+                groups.block(f.tell())
+            word_cnt = read_u16(f)
+            syllable_cnt = read_u16(f)
+            if trace:
+                LOGGER.log(TRACE, "同音词数量：%d，音节索引数量：%d", word_cnt, syllable_cnt)
+                syllables = []
+                for _ in range(syllable_cnt // 2):  # read_uint16 每次读取 2 byte，所以需要除以 2
+                    syllable_index = read_u16(f)
+                    if syllable_index not in syllable_table:
+                        raise ValueError("发现了未注册的拼音索引：{}".format(syllable_index))
+                    syllables.append(syllable_table[syllable_index])
+                full_spell = " ".join(syllables)
+                LOGGER.log(TRACE, "获得全拼：%s", full_spell)
             else:
-                f.read(12)
-                words.append((word, full_spell))
+                blocks += 1
+                raw = f.read(syllable_cnt & ~1)
+                full_spell = spells.get(raw)
+                if full_spell is None:
+                    misses += 1
+                    full_spell = SPELL_MEMO.add(spells, raw, decode_full_spell(raw, syllable_table))
 
-    return words
+            for _ in range(word_cnt):
+                char_cnt = read_u16(f)
+                word = read_str(f, -1, char_cnt)
+                if trace:
+                    LOGGER.log(TRACE, "获得词语：%s，长度：%d", word, char_cnt)
+
+                # ext_len 和 ext 共 12 个字节
+                if use_ext_as_frequency:
+                    f.read(2)
+                    freq = read_u16(f)
+                    f.read(8)
+                    yield word, full_spell, str(freq)
+                else:
+                    f.read(12)
+                    yield word, full_spell
+    finally:
+        SPELL_MEMO.record(blocks - misses, misses)
+        if groups is not None:
+            groups.close(f.tell())
+
+
+def iter_word_table_mmap(buf, hz_offset, syllable_table, use_ext_as_frequency, end=None, block_group=0):
+    """
+    与 iter_word_table 解析相同的格式，但直接在内存映射的缓冲区上工作。
+
+    buf 可以是 mmap 或任意支持缓冲区协议的对象。通过 memoryview 切片和 struct.unpack_from
+    定位各字段，词语直接从切片解码，不产生中间的 bytes 拷贝。
+    全拼通过 SPELL_MEMO 缓存，只在未命中时解码。
+    end 不为 None 时只解析 [hz_offset, end) 范围内的同音词块，两者都必须是块的边界。
+    block_group 大于 0 时每 block_group 个同音词块记录一个 span，见 BlockGroupSpans。
+    """
+    trace = tracing()
+    spells = SPELL_MEMO.table(syllable_table)
+    groups = block_group_spans(block_group)
+    blocks = misses = 0
+    view = memoryview(buf)
+    end = len(view) if end is None else end
+    pos = hz_offset
+    unpack_u16 = _UINT16.unpack_from
+    unpack_head = _BLOCK_HEAD.unpack_from
+    try:
+        while pos < end:
+            if groups is not None:
+                groups.block(pos)
+            word_cnt, syllable_cnt = unpack_head(view, pos)
+            if trace:
+                LOGGER.log(TRACE, "偏移：%d，同音词数量：%d，音节索引数量：%d", pos, word_cnt, syllable_cnt)
+            pos += 4
+            blocks += 1
+            raw = view[pos : pos + (syllable_cnt & ~1)].tobytes()
+            full_spell = spells.get(raw)
+            if full_spell is None:
+                misses += 1
+                full_spell = SPELL_MEMO.add(spells, raw, decode_full_spell(raw, syllable_table))
+            pos += syllable_cnt
+            if trace:
+                LOGGER.log(TRACE, "获得全拼：%s", full_spell)
+
+            for _ in range(word_cnt):
+                char_cnt = unpack_u16(view, pos)[0]
+                pos += 2
+                word = str(view[pos : pos + char_cnt], "UTF-16LE").rstrip("\0")
+                pos += char_cnt
+                if trace:
+                    LOGGER.log(TRACE, "获得词语：%s，长度：%d", word, char_cnt)
+                # ext_len 和 ext 共 12 个字节，第 3、4 字节为词频
+                if use_ext_as_frequency:
+                    freq = unpack_u16(view, pos + 2)[0]
+                    record = (word, full_spell, str(freq))
+                else:
+                    record = (word, full_spell)
+                pos += 12
+                yield record
+    finally:
+        SPELL_MEMO.record(blocks - misses, misses)
+        if groups is not None:
+            groups.close(pos)
+        view.release()
 
 
 def args():
     ap = argparse.ArgumentParser(description="搜狗细胞词库转写为拼音汉字对照表工具。")
-    ap.add_argument("--scel", "-s", type=str, required=True, help="搜狗细胞词库文件。")
+    source = ap.add_mutually_exclusive_group(required=True)
+    source.add_argument("--scel", "-s", type=str, help="搜狗细胞词库文件。")
+    source.add_argument(
+        "--batch",
+        "-b",
+        type=str,
+        nargs="+",
+        metavar="PATH",
+        help="批量转写模式，可以指定多个细胞词库文件、目录（转写其中所有 .scel 文件）或通配符。"
+        "输入中不能有同名的文件；有文件转写失败时以状态 1 退出。",
+    )
+    source.add_argument(
+        "--watch",
+        "-w",
+        type=str,
+        metavar="DIR",
+        help=(
+            "监视模式，持续转写 DIR 中新出现或发生变化的 .scel 文件，输出规则与批量转写模式相同，按 Ctrl-C 退出。"
+            "指定 '--rime-dir' 时总是使用 '--word-index'。"
+        ),
+    )
     ap.add_argument("--output", "-o", type=str, required=False, help="转写后输出的文件名，默认使用词库元信息中的标题。")
+    ap.add_argument(
+        "--output-dir",
+        type=str,
+        required=False,
+        default=os.path.curdir,
+        help="批量转写和监视模式下文本文件的输出目录，文件名与细胞词库文件名相同，默认为当前目录。",
+    )
+    ap.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        required=False,
+        default=None,
+        help="批量转写模式下的并行进程数，或 '--parser parallel' 时单个文件的解码进程数，默认为 CPU 核数。",
+    )
+    ap.add_argument(
+        "--watch-interval",
+        type=float,
+        required=False,
+        default=WATCH_INTERVAL,
+        help="监视模式下检查目录的间隔（秒），默认 %(default)s。",
+    )
+    ap.add_argument(
+        "--watch-settle",
+        type=float,
+        required=False,
+        default=WATCH_SETTLE,
+        help="监视模式下文件的大小和修改时间保持不变多少秒后才转写，避免转写尚未写完的文件，默认 %(default)s。",
+    )
     ap.add_argument(
         "--use-ext-as-frequency",
         required=False,
@@ -180,6 +786,139 @@ def args():
         default=False,
         help="使用词库文件中的扩展字段第一个整数作为词频。",
     )
+    ap.add_argument(
+        "--parser",
+        type=str,
+        required=False,
+        choices=PARSERS,
+        default="stream",
+        help=(
+            "汉语词组表的解析方式，默认为 stream。"
+            "mmap 使用内存映射解析，适用于较大的词库文件；"
+            "parallel 由多个进程并行解码单个文件，适用于特别大的词库文件，进程数由 '--jobs' 指定。"
+        ),
+    )
+    ap.add_argument(
+        "--mmap",
+        dest="parser",
+        action="store_const",
+        const="mmap",
+        default=argparse.SUPPRESS,
+        help="等同于 '--parser mmap'。",
+    )
+    ap.add_argument(
+        "--dedup",
+        type=str,
+        required=False,
+        choices=InFileDedup.KEYS,
+        help=(
+            "去除同一个细胞词库中重复的记录：word 按词语去重，word-spell 按词语和全拼去重。"
+            "同一个词语常常出现在多个同音词块中，去重后输出更小，生成 Rime 词典时的去重也更快。"
+        ),
+    )
+    ap.add_argument(
+        "--dedup-keep",
+        type=str,
+        required=False,
+        choices=InFileDedup.KEEPS,
+        default="first",
+        help="'--dedup' 保留的记录：first 为第一次出现的记录（默认），max-freq 为词频最高的记录，需要 '--use-ext-as-frequency'。",
+    )
+    ap.add_argument(
+        "--cache-dir",
+        type=str,
+        required=False,
+        nargs="?",
+        const=DEFAULT_CACHE_DIR,
+        help=(
+            "开启解析缓存，内容未变化的细胞词库不再重复解析。"
+            "可以指定缓存目录，默认为 {}。使用 scel_cache.py 查看和清理缓存。".format(DEFAULT_CACHE_DIR)
+        ),
+    )
+    ap.add_argument(
+        "--cache-max-size",
+        type=int,
+        required=False,
+        default=DEFAULT_CACHE_MAX_SIZE >> 20,
+        help="解析缓存的最大容量（MB），超出后淘汰最久未使用的条目，默认 %(default)s。",
+    )
+    ap.add_argument(
+        "--compact-records",
+        action="store_true",
+        required=False,
+        default=False,
+        help="按列存储需要保留的记录（生成 Rime 词典、批量转写时），峰值内存约为默认方式的一半，但转写较慢。",
+    )
+    ap.add_argument(
+        "--spell-memo-size",
+        type=int,
+        required=False,
+        default=SPELL_MEMO.maxsize,
+        help="每种音节表的全拼缓存的最大条目数，0 表示不缓存，默认 %(default)s。运行结束时会输出缓存的命中情况。",
+    )
+    ap.add_argument(
+        "--trace",
+        required=False,
+        action="store_true",
+        default=False,
+        help="输出跟踪级别的日志，记录解析出的每个字段和词语，会显著降低转写速度。也可以通过 PY_LOG_LEVEL=TRACE 开启。",
+    )
+    ap.add_argument(
+        "--profile",
+        type=str,
+        required=False,
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help=(
+            "记录各阶段的墙钟时间、CPU 时间、读写字节数和记录数，以 JSON 格式写入 FILE，省略 FILE 时输出到标准输出。"
+            "开启后词组表会先完整解析再写出，以便分别计时。"
+        ),
+    )
+    ap.add_argument(
+        "--profile-stage",
+        type=str,
+        required=False,
+        choices=PROFILE_STAGES,
+        default="word_table",
+        help="使用 cProfile 剖析的阶段，默认 %(default)s，需要同时指定 '--profile-dump'。",
+    )
+    ap.add_argument(
+        "--profile-dump",
+        type=str,
+        required=False,
+        metavar="FILE",
+        help="把 '--profile-stage' 阶段的 cProfile 结果写入 FILE，可以用 pstats 或 snakeviz 查看。"
+        "只剖析主进程，批量转写时需要指定 '--jobs 1'。",
+    )
+    ap.add_argument(
+        "--metrics",
+        type=str,
+        required=False,
+        metavar="FILE",
+        help=(
+            "运行结束时把解析和去重的词语数、读写字节数、各阶段耗时直方图和按类型统计的失败次数"
+            "以 Prometheus 文本格式写入 FILE，供 node_exporter 的 textfile collector 采集。与 '--profile' 一样会分别计时各阶段。"
+        ),
+    )
+    ap.add_argument(
+        "--chrome-trace",
+        type=str,
+        required=False,
+        metavar="FILE",
+        help=(
+            "把各阶段和批量转写中每个文件的耗时以 Chrome trace-event 格式写入 FILE，可以用 Perfetto 打开。"
+            "与 '--profile' 一样会分别计时各阶段。"
+        ),
+    )
+    ap.add_argument(
+        "--trace-block-group",
+        type=int,
+        required=False,
+        default=0,
+        metavar="N",
+        help="配合 '--chrome-trace' 使用，解析词组表时每 N 个同音词块记录一个 span，默认 0 不记录。",
+    )
     ap.add_argument(
         "--rime-dir",
         "-u",
@@ -195,41 +934,254 @@ def args():
         help=(
             "如果指定了 '--rime-dir'，此选项会被用作生成的字典名称，且为必选项。"
             "如果未指定 '--rime-dir'，此选项会被忽略。"
+            "批量转写模式下字典名称为细胞词库文件名，此选项可选，指定后作为字典名称的前缀。"
         ),
     )
+    ap.add_argument(
+        "--header",
+        type=str,
+        required=False,
+        metavar="PATH",
+        help=(
+            "生成 Rime 词典时使用的词典头模板，默认为与本程序同目录的 header.yaml。"
+            "模板中的 {} 和 {} 分别替换为细胞词库文件名和字典名称。".format(PH_SOURCE_FILE, PH_DICT_NAME)
+        ),
+    )
+    ap.add_argument(
+        "--word-index",
+        required=False,
+        action="store_true",
+        default=False,
+        help="在 Rime 用户文件夹中维护 cn_dicts 的词语索引（{}），去重时只重新解析发生变化的词典。".format(WORD_INDEX_FILE),
+    )
     return ap.parse_args()
 
 
-def read_header(scel, dict_name):
-    with open(HEADER_YAML, encoding="utf8") as fp:
-        header = fp.read()
-    header = header.replace(PH_SOURCE_FILE, os.path.basename(scel))
-    header = header.replace(PH_DICT_NAME, dict_name)
-    header = header.strip()
-    return header
+class HeaderTemplate:
+    """
+    编译后的词典头模板。模板中的 PH_SOURCE_FILE 和 PH_DICT_NAME 在编译时转换为 str.format 的字段，
+    渲染时只需一次格式化，不再逐个替换占位符。
+    """
 
+    def __init__(self, text) -> None:
+        text = text.strip().replace("{", "{{").replace("}", "}}")
+        text = text.replace(PH_SOURCE_FILE, "{source_file}").replace(PH_DICT_NAME, "{dict_name}")
+        self._format = text.format
 
-def unique_words(cn_dicts, records):
-    def _words_set(path):
+    @classmethod
+    def from_file(cls, path):
         with open(path, encoding="utf8") as fp:
-            lines = fp.readlines()
-            index = lines.index("...\n")
-            if lines[-1].strip() == "":
-                lines = lines[:-1]
-            return set(map(lambda x: x.split("\t")[0], lines[index + 1 :]))
-
-    def _check_word(record, old_words):
-        if record[0] not in old_words:
-            return False
-        LOGGER.debug("词语 '%s' 重复。", record[0])
-        return True
-
-    res_records = records
+            return cls(fp.read())
+
+    def render(self, scel, dict_name):
+        return self._format(source_file=os.path.basename(scel), dict_name=dict_name)
+
+
+# 模板文件的绝对路径 -> HeaderTemplate，在进程的生命周期内只读取一次
+_HEADER_TEMPLATES = {}
+
+
+def header_template(path=None):
+    """
+    返回编译后的词典头模板，path 默认为 HEADER_YAML。同一个模板文件只读取和编译一次。
+    """
+    path = os.path.abspath(path or HEADER_YAML)
+    template = _HEADER_TEMPLATES.get(path)
+    if template is None:
+        LOGGER.debug("读取词典头模板：%s", path)
+        template = _HEADER_TEMPLATES[path] = HeaderTemplate.from_file(path)
+    return template
+
+
+def read_header(scel, dict_name, template=None):
+    return header_template(template).render(scel, dict_name)
+
+
+DICT_READ_BUFFER_SIZE = 1 << 20
+# 每行的第一列：行首到第一个制表符或行尾，每次匹配消耗一整行（包括换行符）
+_FIRST_COLUMN = re.compile(r"([^\t\r\n]*)[^\n]*\n")
+
+
+def iter_dict_words(path):
+    """
+    读取 Rime 词典文件，跳过 YAML 文件头（到 "..." 为止），产出每个条目的第一列。
+
+    文件头逐行读取，找到 "..." 后停止；之后的内容以 DICT_READ_BUFFER_SIZE 大小的块读取，
+    每块在最后一个换行处截断，整块解码后用正则表达式一次取出所有行的第一列，不拆分整行，
+    也不在内存中保留整个文件。没有 "..." 时抛出 ValueError。
+    """
+    nbytes = 0
+    try:
+        with open(path, "rb") as fp:
+            for line in fp:
+                nbytes += len(line)
+                if line.rstrip(b"\r\n") == b"...":
+                    break
+            else:
+                raise ValueError("词典文件中没有 YAML 文件头的结束标记 '...'：{}".format(path))
+            rest = b""
+            while True:
+                chunk = fp.read(DICT_READ_BUFFER_SIZE)
+                nbytes += len(chunk)
+                if not chunk:
+                    break
+                chunk = rest + chunk
+                cut = chunk.rfind(b"\n") + 1
+                rest = chunk[cut:]
+                yield from filter(None, _FIRST_COLUMN.findall(chunk[:cut].decode("utf8")))
+            yield from filter(None, _FIRST_COLUMN.findall(rest.decode("utf8") + "\n"))
+    finally:
+        COUNTERS["dict_bytes_read"] += nbytes
+
+
+def read_dict_words(path):
+    """
+    读取 Rime 词典文件中收录的词语（每个条目的第一列）。
+    """
+    return set(iter_dict_words(path))
+
+
+WORD_INDEX_FILE = "cn_dicts.index.sqlite"
+WORD_INDEX_QUERY_SIZE = 500
+
+
+class WordIndex:
+    """
+    cn_dicts 中已收录词语的持久化索引，保存在 cn_dicts 旁边的 sqlite 文件中。
+
+    索引记录了每个词典文件的大小和修改时间，refresh 时只重新解析发生变化的文件。
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS words (
+                word TEXT NOT NULL,
+                file_id INTEGER NOT NULL,
+                PRIMARY KEY (word, file_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS words_file_id ON words (file_id);
+            """
+        )
+
+    @classmethod
+    def for_rime_dir(cls, rime_dir):
+        os.makedirs(rime_dir, exist_ok=True)
+        return cls(os.path.join(rime_dir, WORD_INDEX_FILE))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remove_file(self, name):
+        row = self.conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute("DELETE FROM words WHERE file_id = ?", row)
+        self.conn.execute("DELETE FROM files WHERE id = ?", row)
+
+    def _put_file(self, name, stat, words):
+        self._remove_file(name)
+        cursor = self.conn.execute(
+            "INSERT INTO files (name, size, mtime_ns) VALUES (?, ?, ?)",
+            (name, stat.st_size, stat.st_mtime_ns),
+        )
+        file_id = cursor.lastrowid
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO words (word, file_id) VALUES (?, ?)",
+            ((word, file_id) for word in words),
+        )
+
+    def refresh(self, cn_dicts):
+        """
+        使索引与 cn_dicts 目录保持一致：解析新增或大小、修改时间发生变化的文件，删除已不存在的文件。
+        """
+        rows = self.conn.execute("SELECT name, size, mtime_ns FROM files")
+        indexed = {name: (size, mtime_ns) for name, size, mtime_ns in rows}
+        names = set(os.listdir(cn_dicts))
+        with self.conn:
+            for name in indexed.keys() - names:
+                LOGGER.info("从索引中移除文件：%s", name)
+                self._remove_file(name)
+            for name in sorted(names):
+                stat = os.stat(os.path.join(cn_dicts, name))
+                if indexed.get(name) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                LOGGER.info("更新索引文件：%s", name)
+                words = read_dict_words(os.path.join(cn_dicts, name))
+                LOGGER.info("文件中包含 %d 个词语。", len(words))
+                self._put_file(name, stat, words)
+
+    def add_file(self, path, words):
+        """
+        记录一个刚刚写入 cn_dicts 的词典文件，words 为其中收录的词语，无需重新解析该文件。
+        """
+        with self.conn:
+            self._put_file(os.path.basename(path), os.stat(path), words)
+
+    def existing(self, words):
+        """
+        返回 words 中已被 cn_dicts 收录的词语集合。
+        """
+        words = list(words)
+        found = set()
+        for i in range(0, len(words), WORD_INDEX_QUERY_SIZE):
+            chunk = words[i : i + WORD_INDEX_QUERY_SIZE]
+            sql = "SELECT DISTINCT word FROM words WHERE word IN ({})".format(",".join("?" * len(chunk)))
+            found.update(row[0] for row in self.conn.execute(sql, chunk))
+        return found
+
+
+def existing_words(cn_dicts):
+    """
+    合并 cn_dicts 中所有词典收录的词语，返回一个集合。
+    """
+    words = set()
     for name in os.listdir(cn_dicts):
         LOGGER.info("对比文件：%s", name)
-        words = _words_set(os.path.join(cn_dicts, name))
-        LOGGER.info("文件中包含 %d 个词语。", len(words))
-        res_records = [record for record in res_records if not _check_word(record, words)]
+        file_words = read_dict_words(os.path.join(cn_dicts, name))
+        LOGGER.info("文件中包含 %d 个词语。", len(file_words))
+        COUNTERS["dedup_dict_files"] += 1
+        COUNTERS["dedup_dict_words"] += len(file_words)
+        words |= file_words
+    return words
+
+
+def unique_words(cn_dicts, records, index=None):
+    """
+    过滤掉已被 cn_dicts 收录的词语。所有已有词典先合并为一个集合，再对新词语做一遍过滤，
+    每条记录只做一次集合查询，与 cn_dicts 中的文件数量无关。
+    """
+    if index is not None:
+        index.refresh(cn_dicts)
+        candidates = records.words() if isinstance(records, RecordTable) else (record[0] for record in records)
+        words = index.existing(set(candidates))
+    else:
+        words = existing_words(cn_dicts)
+    if isinstance(records, RecordTable):
+        res_records = records.without(words)
+    else:
+        res_records = [record for record in records if record[0] not in words]
+    COUNTERS["dedup_records_checked"] += len(records)
+    COUNTERS["dedup_duplicates"] += len(records) - len(res_records)
+    if tracing():
+        for record in records:
+            if record[0] in words:
+                LOGGER.log(TRACE, "词语 '%s' 重复。", record[0])
     if len(records) > len(res_records):
         LOGGER.info("去重词语 %d 个。", len(records) - len(res_records))
     return res_records
@@ -245,17 +1197,625 @@ def make_path(dict_name, rime_dir):
     return full_path, cn_dicts
 
 
-def read_scel(scel, use_ext_as_frequency):
+class _SpellIndex(dict):
+    """
+    全拼 -> 编号，查询不存在的全拼时分配新编号并追加到 spells，
+    可以直接用 map(index.__getitem__, ...) 批量转换。
+    """
+
+    def __init__(self, spells) -> None:
+        super().__init__()
+        self._spells = spells
+
+    def __missing__(self, full_spell):
+        spell_id = self[full_spell] = len(self._spells)
+        self._spells.append(full_spell)
+        return spell_id
+
+
+# RecordTable.from_records 每批按列处理的记录数
+RECORD_TABLE_CHUNK = 1 << 16
+_FIELD_0, _FIELD_1, _FIELD_2 = map(operator.itemgetter, range(3))
+# 词语长度加上结尾的 NUL
+_PLUS_ONE = (1).__add__
+# 把 0/1 组成的掩码取反
+_INVERT_MASK = bytes.maketrans(b"\0\1", b"\1\0")
+
+
+class RecordTable:
+    """
+    按列存储的词语记录，用于替代大量 (词语, 全拼[, 词频]) 元组组成的列表。
+
+    - 词语：每个词语后加一个 NUL，以 UTF-16LE 编码拼接在一个 bytearray 中，
+      array('I') 记录每个词语的起始偏移（以 2 字节为单位），按 NUL 切分即可一次取出一批词语
+    - 全拼：相同的全拼只保存一份，array('I') 记录每条记录的全拼编号
+    - 词频：array('H')，只在记录包含词频时使用
+
+    迭代、下标访问时按需构造与原来相同的记录元组，所以可以直接用于 to_raw_txt、unique_words 等函数。
+    """
+
+    def __init__(self, has_freq) -> None:
+        self.has_freq = has_freq
+        self._text = bytearray()
+        self._offsets = array("I", [0])
+        self._spell_ids = array("I")
+        self._spells = []
+        self._spell_index = _SpellIndex(self._spells)
+        self._freqs = array("H")
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        从记录的可迭代对象构造，是否包含词频由第一条记录决定。
+        """
+        records = iter(records)
+        first = next(records, None)
+        table = cls(first is not None and len(first) > 2)
+        if first is None:
+            return table
+        records = itertools.chain([first], records)
+        spell_id = table._spell_index.__getitem__
+        while True:
+            chunk = list(itertools.islice(records, RECORD_TABLE_CHUNK))
+            if not chunk:
+                break
+            # 按列处理一批记录，逐条的工作只剩 C 实现的 map、itemgetter 和字典查询
+            words = list(map(_FIELD_0, chunk))
+            freqs = map(int, map(_FIELD_2, chunk)) if table.has_freq else None
+            table._extend(words, map(spell_id, map(_FIELD_1, chunk)), freqs)
+        return table
+
+    def _extend(self, words, spell_ids, freqs=None):
+        """
+        追加一批记录：words 为词语序列，spell_ids 为全拼编号的可迭代对象。
+        词语整批编码一次，偏移由各词语的长度累加得到。
+        """
+        if not words:
+            return
+        encoded = ("\0".join(words) + "\0").encode("UTF-16LE")
+        lengths = map(len, words)
+        offsets = array("I", itertools.accumulate(map(_PLUS_ONE, lengths), initial=self._offsets[-1]))
+        if (offsets[-1] - offsets[0]) * 2 != len(encoded):
+            # 包含代理对时字符数与 UTF-16 编码单元数不一致，按编码后的长度计算偏移
+            lengths = (len(word.encode("UTF-16LE")) >> 1 for word in words)
+            offsets = array("I", itertools.accumulate(map(_PLUS_ONE, lengths), initial=self._offsets[-1]))
+        self._text += encoded
+        self._offsets.extend(offsets[1:])
+        self._spell_ids.extend(spell_ids)
+        if self.has_freq:
+            self._freqs.extend(freqs)
+
+    def word(self, i):
+        return self._text[self._offsets[i] * 2 : self._offsets[i + 1] * 2 - 2].decode("UTF-16LE")
+
+    def words(self):
+        """
+        按顺序逐批产出词语：每批解码一次、按 NUL 切分，不为每个词语单独解码。
+        """
+        return itertools.chain.from_iterable(map(self._word_chunk, range(0, len(self), RECORD_TABLE_CHUNK)))
+
+    def _word_chunk(self, first):
+        last = min(first + RECORD_TABLE_CHUNK, len(self))
+        start, stop = self._offsets[first] * 2, self._offsets[last] * 2
+        words = self._text[start : stop - 2].decode("UTF-16LE").split("\0")
+        if len(words) != last - first:
+            # 词语本身包含 NUL，按偏移逐个解码
+            return map(self.word, range(first, last))
+        return words
+
+    def __len__(self):
+        return len(self._spell_ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("record index out of range")
+        if self.has_freq:
+            return self.word(i), self._spells[self._spell_ids[i]], str(self._freqs[i])
+        return self.word(i), self._spells[self._spell_ids[i]]
+
+    def __iter__(self):
+        full_spells = map(self._spells.__getitem__, self._spell_ids)
+        if self.has_freq:
+            return zip(self.words(), full_spells, map(str, self._freqs))
+        return zip(self.words(), full_spells)
+
+    def without(self, words):
+        """
+        返回去掉词语在 words（集合）中的记录后的新 RecordTable，逐条的判断都在 C 实现中完成。
+        """
+        return self.select(bytes(map(words.__contains__, self.words())).translate(_INVERT_MASK))
+
+    def select(self, mask):
+        """
+        返回只包含 mask[i] 为真的记录的新 RecordTable，全拼表原样复制。逐批复制，不同时解码所有词语。
+        """
+        table = RecordTable(self.has_freq)
+        table._spells.extend(self._spells)
+        table._spell_index.update(self._spell_index)
+        for first in range(0, len(self), RECORD_TABLE_CHUNK):
+            last = min(first + RECORD_TABLE_CHUNK, len(self))
+            keep = mask[first:last]
+            freqs = itertools.compress(self._freqs[first:last], keep) if self.has_freq else None
+            words = list(itertools.compress(self._word_chunk(first), keep))
+            table._extend(words, itertools.compress(self._spell_ids[first:last], keep), freqs)
+        return table
+
+    @classmethod
+    def concat(cls, tables, has_freq):
+        """
+        按顺序逐列拼接多个 RecordTable，词语以原始编码复制，全拼编号映射到合并后的全拼表。
+        """
+        table = cls(has_freq)
+        for other in tables:
+            base = table._offsets[-1]
+            table._text += other._text
+            table._offsets.extend(map(base.__add__, other._offsets[1:]))
+            remap = list(map(table._spell_index.__getitem__, other._spells))
+            table._spell_ids.extend(map(remap.__getitem__, other._spell_ids))
+            if has_freq:
+                table._freqs.extend(other._freqs)
+        return table
+
+
+class InFileDedup:
+    """
+    去除同一个细胞词库中重复的记录。同一个词语常常出现在多个同音词块中（多音字），
+    key 为 "word" 时按词语去重，为 "word-spell" 时按 (词语, 全拼) 去重。
+
+    keep 为 "first" 时保留第一次出现的记录，逐条过滤，不保留记录本身；为 "max-freq" 时保留词频最高的记录
+    （相同时保留先出现的），需要先读取全部记录。两种方式都只保存键的 64 位哈希，不保存键本身，
+    一个文件内发生哈希碰撞的概率可以忽略。
+    """
+
+    KEYS = ("word", "word-spell")
+    KEEPS = ("first", "max-freq")
+
+    def __init__(self, key="word", keep="first") -> None:
+        if key not in self.KEYS:
+            raise ValueError("不支持的去重键：{}".format(key))
+        if keep not in self.KEEPS:
+            raise ValueError("不支持的保留方式：{}".format(keep))
+        self.key = key
+        self.keep = keep
+
+    def __repr__(self) -> str:
+        return "InFileDedup(key={!r}, keep={!r})".format(self.key, self.keep)
+
+    def _hashes(self, records):
+        if self.key == "word":
+            return map(hash, (record[0] for record in records))
+        return map(hash, (record[:2] for record in records))
+
+    def __call__(self, records):
+        """
+        返回去重后的记录：keep 为 "first" 时是迭代器，为 "max-freq" 时是 RecordTable。
+        """
+        if self.keep == "first":
+            return self._first(records)
+        return self._max_freq(records)
+
+    def _report(self, total, kept):
+        COUNTERS["infile_records"] += total
+        COUNTERS["infile_duplicates"] += total - kept
+        if total > kept:
+            LOGGER.info("文件内重复的记录 %d 条，已去除。", total - kept)
+
+    def _first(self, records):
+        seen = set()
+        total = 0
+        by_word = self.key == "word"
+        for record in records:
+            total += 1
+            h = hash(record[0] if by_word else record[:2])
+            if h in seen:
+                continue
+            seen.add(h)
+            yield record
+        self._report(total, len(seen))
+
+    def _max_freq(self, records):
+        if not isinstance(records, RecordTable):
+            records = RecordTable.from_records(records)
+        if not records.has_freq:
+            raise ValueError("按词频去重需要记录包含词频（'--use-ext-as-frequency'）。")
+        freqs = records._freqs
+        best = {}
+        for i, h in enumerate(self._hashes(records)):
+            j = best.setdefault(h, i)
+            if freqs[i] > freqs[j]:
+                best[h] = i
+        mask = bytearray(len(records))
+        for i in best.values():
+            mask[i] = 1
+        self._report(len(records), len(best))
+        return records.select(mask)
+
+
+# 词组表的解析方式：stream 为逐字段读取文件，mmap 基于内存映射解析，
+# parallel 预扫描同音词块的偏移后由多个进程并行解码。
+# 用 NumPy 解码音节索引的方式试过，比 mmap 慢一倍以上，耗时主要在逐词解码，没有保留
+PARSERS = ("stream", "mmap", "parallel")
+
+
+def read_scel(scel, use_ext_as_frequency, parser="stream", cache=None):
+    meta, records = iter_scel(scel, use_ext_as_frequency, parser, cache)
+    return meta, list(records)
+
+
+def iter_scel(scel, use_ext_as_frequency, parser="stream", cache=None):
+    """
+    读取细胞词库的元信息和音节表，返回元信息和一个逐条产出词语记录的迭代器。
+
+    词组表只在迭代时才会被打开和解析，迭代结束（或迭代器被回收）时关闭文件。
+    parallel 解析方式启动了进程池时例外：返回前已经解析完整个词组表，记录以 RecordTable 返回。
+    指定了 cache（ParseCache）时，缓存命中则直接返回缓存的结果，不再解析词组表；
+    未命中时在迭代完成后把结果写入缓存，此时迭代期间会保留全部记录。
+    """
+    if cache is not None:
+        key = cache.key(scel, use_ext_as_frequency)
+        cached = cache.get(key)
+        if cached is not None:
+            meta, records = cached
+            LOGGER.info("命中解析缓存：%s", scel)
+            LOGGER.info("细胞词库元信息：%s", meta)
+            return meta, iter(records)
+        meta, records = iter_scel(scel, use_ext_as_frequency, parser)
+        return meta, cache.storing(key, meta, records)
+
     with open(scel, "rb") as fp:
-        hz_offset = get_hz_offset(fp)
+        with profile_stage("get_hz_offset") as stage:
+            hz_offset = get_hz_offset(fp)
+            stage["bytes_read"] += fp.tell()
 
-        meta = get_dict_meta(fp)
+        with profile_stage("get_dict_meta") as stage:
+            meta = get_dict_meta(fp)
+            stage["bytes_read"] += 0x1540 - 0x130
         LOGGER.info("细胞词库元信息：%s", meta)
 
-        py_map = syllable_table(fp)
+        with profile_stage("syllable_table") as stage:
+            py_map = syllable_table(fp)
+            stage["bytes_read"] += fp.tell() - 0x1540
+            stage["records"] += len(py_map)
+
+    if parser == "parallel":
+        table = read_word_table_parallel(scel, hz_offset, py_map, use_ext_as_frequency, PARALLEL_JOBS)
+        if table is not None:
+            return meta, table
+    return meta, _iter_scel_records(scel, hz_offset, py_map, use_ext_as_frequency, parser)
+
+
+def scan_blocks(buf, hz_offset, end=None):
+    """
+    预扫描汉语词组表，只读取长度字段，不解码任何文本，返回每个同音词块的起始偏移（array('Q')）。
+    """
+    view = memoryview(buf)
+    end = len(view) if end is None else end
+    unpack_u16 = _UINT16.unpack_from
+    unpack_head = _BLOCK_HEAD.unpack_from
+    offsets = array("Q")
+    pos = hz_offset
+    try:
+        while pos < end:
+            offsets.append(pos)
+            word_cnt, syllable_cnt = unpack_head(view, pos)
+            pos += 4 + syllable_cnt
+            for _ in range(word_cnt):
+                # 2 字节长度 + 词语 + 12 字节扩展信息
+                pos += unpack_u16(view, pos)[0] + 14
+    finally:
+        view.release()
+    if pos != end:
+        raise ValueError("汉语词组表在偏移 {} 处越界，文件可能已损坏。".format(pos))
+    return offsets
+
+
+def split_block_ranges(offsets, end, parts):
+    """
+    把同音词块按字节数大致均分为 parts 段，返回 [(start, end), ...]，每段的边界都是块的边界。
+    """
+    if not offsets:
+        return []
+    start = offsets[0]
+    step = max((end - start) // max(parts, 1), 1)
+    ranges = []
+    boundary = start + step
+    for offset in offsets:
+        if offset >= boundary:
+            ranges.append((start, offset))
+            start = offset
+            boundary = offset + step
+    ranges.append((start, end))
+    return ranges
+
+
+# parallel 解析方式的工作进程数，None 表示 CPU 核数；每个进程分到的段数，分得更细以平衡负载
+PARALLEL_JOBS = None
+PARALLEL_RANGES_PER_JOB = 4
+# 词组表小于该字节数时不值得启动进程池，直接在当前进程中解析
+PARALLEL_MIN_BYTES = 4 << 20
+
+
+def process_pool(max_workers):
+    """
+    创建进程池。工作进程不一定通过 fork 继承日志配置，按当前进程的配置重新初始化。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    initializer, initargs = None, ()
+    if _LOG_FILE is not None:
+        initializer, initargs = simple_logger, (LOGGER.level, _LOG_FILE)
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+
+
+def decode_block_range(scel, start, end, syllable_table, use_ext_as_frequency):
+    """
+    在工作进程中解码 [start, end) 范围内的同音词块，以 RecordTable 返回，减少进程间传输的数据量；
+    同时返回这一段的全拼缓存 (命中, 未命中) 次数，由主进程合并。
+    """
+    hits, misses = SPELL_MEMO.hits, SPELL_MEMO.misses
+    with open(scel, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        records = iter_word_table_mmap(buf, start, syllable_table, use_ext_as_frequency, end=end)
+        table = RecordTable.from_records(records)
+    return table, (SPELL_MEMO.hits - hits, SPELL_MEMO.misses - misses)
+
+
+def read_word_table_parallel(scel, hz_offset, syllable_table, use_ext_as_frequency, jobs=None):
+    """
+    两阶段解析：先用 scan_blocks 找出所有同音词块的偏移，再把块按范围分给多个进程解码，
+    各进程返回的 RecordTable 按原顺序逐列拼接后返回，主进程不再逐条构造记录。
+    只有一个进程或词组表太小、不值得启动进程池时返回 None，由调用方在当前进程中解析。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    with open(scel, "rb") as fp:
+        end = os.fstat(fp.fileno()).st_size
+        if jobs == 1 or end - hz_offset < PARALLEL_MIN_BYTES:
+            return None
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            offsets = scan_blocks(buf, hz_offset)
+    ranges = split_block_ranges(offsets, end, jobs * PARALLEL_RANGES_PER_JOB)
+    LOGGER.info("汉语词组表共 %d 个同音词块，分为 %d 段，由 %d 个进程解码。", len(offsets), len(ranges), jobs)
+    del offsets
+    n = len(ranges)
+    with profile_stage("word_table") as stage, process_pool(min(jobs, n)) as executor:
+        stage["bytes_read"] += end - hz_offset
+        results = executor.map(
+            decode_block_range,
+            itertools.repeat(scel, n),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+            itertools.repeat(syllable_table, n),
+            itertools.repeat(use_ext_as_frequency, n),
+        )
+        tables = []
+        for i in range(n):
+            # 等待工作进程返回结果的时间，各段之间的空隙即为主进程的等待
+            with profile_span("wait_block_range", index=i, start=ranges[i][0], stop=ranges[i][1]):
+                table, spell_memo = next(results)
+            SPELL_MEMO.record(*spell_memo)
+            tables.append(table)
+        table = RecordTable.concat(tables, use_ext_as_frequency)
+        stage["records"] += len(table)
+        return table
+
+
+def _iter_scel_records(scel, hz_offset, py_map, use_ext_as_frequency, parser):
+    if parser not in PARSERS:
+        raise ValueError("不支持的解析方式：{}".format(parser))
+    block_group = PROFILE.block_group if PROFILE is not None else 0
+    with open(scel, "rb") as fp:
+        if PROFILE is not None:
+            PROFILE.count("word_table", bytes_read=os.fstat(fp.fileno()).st_size - hz_offset)
+        if parser != "stream":
+            # parallel 解析方式不值得启动进程池时也在这里解析
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield from iter_word_table_mmap(buf, hz_offset, py_map, use_ext_as_frequency, block_group=block_group)
+        else:
+            file_size = os.fstat(fp.fileno()).st_size
+            yield from iter_word_table(fp, file_size, hz_offset, py_map, use_ext_as_frequency, block_group)
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "scel_transfer"
+)
+DEFAULT_CACHE_MAX_SIZE = 1 << 30
+
+
+class ParseCache:
+    """
+    以文件内容的 sha256 和 use_ext_as_frequency 为键的解析结果缓存，每个条目是缓存目录中的一个文件。
+
+    条目的格式：
+    - 8 字节：魔数 CACHE_MAGIC
+    - 4 字节：元信息 JSON 的字节长度 -> length
+    - length 字节：元信息 JSON，包括 DictMeta 各字段、词语数量和是否包含词频，查看缓存时只需读取这一部分
+    - 其余部分：zlib 压缩的记录，依次为长度信息、全拼表、全拼编号（uint32 数组）、词频（uint16 数组）和词语
+
+    命中时会更新条目的修改时间，写入后按修改时间从旧到新淘汰条目，直到缓存总大小不超过 max_size。
+    """
+
+    CACHE_MAGIC = b"SCELPC\x00\x01"
+    SUFFIX = ".cache"
+    _LENGTHS = struct.Struct("<IIII")
 
-        file_size = os.path.getsize(scel)
-        return meta, word_table(fp, file_size, hz_offset, py_map, use_ext_as_frequency)
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_MAX_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, scel, use_ext_as_frequency):
+        digest = hashlib.sha256()
+        with open(scel, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(chunk)
+        return "{}-{}".format(digest.hexdigest(), "freq" if use_ext_as_frequency else "nofreq")
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def get(self, key):
+        """
+        返回 (DictMeta, 记录列表)，未命中或条目损坏时返回 None。
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fp:
+                info = self._read_info(fp)
+                payload = zlib.decompress(fp.read())
+            result = self._meta(info), self._decode_records(payload, info["words"], info["freq"])
+            os.utime(path)
+        except FileNotFoundError:
+            COUNTERS["parse_cache_misses"] += 1
+            return None
+        except (OSError, ValueError, KeyError, struct.error, UnicodeDecodeError, zlib.error) as e:
+            LOGGER.warning("解析缓存条目损坏，已忽略：%s，%s", path, e)
+            COUNTERS["parse_cache_misses"] += 1
+            return None
+        COUNTERS["parse_cache_hits"] += 1
+        return result
+
+    def storing(self, key, meta, records):
+        """
+        逐条产出 records，全部产出后把结果写入缓存。
+        """
+        kept = []
+        for record in records:
+            kept.append(record)
+            yield record
+        self.put(key, meta, kept)
+
+    def put(self, key, meta, records):
+        if any("\0" in record[0] for record in records):
+            LOGGER.warning("词语中包含 '\\0'，不写入解析缓存。")
+            return
+        has_freq = bool(records) and len(records[0]) > 2
+        info = {
+            "title": meta.title,
+            "category": meta.category,
+            "desc": meta.desc,
+            "samples": meta.samples,
+            "words": len(records),
+            "freq": has_freq,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as fp:
+            raw_info = json.dumps(info, ensure_ascii=False).encode("utf8")
+            fp.write(self.CACHE_MAGIC + struct.pack("<I", len(raw_info)) + raw_info)
+            fp.write(zlib.compress(self._encode_records(records, has_freq), 1))
+        os.replace(tmp, path)
+        self.prune(self.max_size)
+
+    def _read_info(self, fp):
+        if fp.read(len(self.CACHE_MAGIC)) != self.CACHE_MAGIC:
+            raise ValueError("unknown cache magic")
+        raw_length = fp.read(4)
+        if len(raw_length) != 4:
+            raise ValueError("cache entry is truncated")
+        (length,) = struct.unpack("<I", raw_length)
+        raw_info = fp.read(length)
+        if len(raw_info) != length:
+            raise ValueError("cache entry is truncated")
+        info = json.loads(raw_info.decode("utf8"))
+        if not isinstance(info, dict):
+            raise ValueError("cache entry info is not an object")
+        return info
+
+    @staticmethod
+    def _meta(info):
+        return DictMeta(info["title"], info["category"], info["desc"], info["samples"])
+
+    @staticmethod
+    def _le_bytes(arr):
+        if sys.byteorder == "big":
+            arr.byteswap()
+        return arr.tobytes()
+
+    def _encode_records(self, records, has_freq):
+        spell_ids = {}
+        ids = array("I", (spell_ids.setdefault(record[1], len(spell_ids)) for record in records))
+        spells = "\0".join(spell_ids).encode("utf8")
+        words = "\0".join(record[0] for record in records).encode("utf8")
+        freqs = array("H", (int(record[2]) for record in records) if has_freq else ())
+        raw_ids, raw_freqs = self._le_bytes(ids), self._le_bytes(freqs)
+        lengths = self._LENGTHS.pack(len(spells), len(raw_ids), len(raw_freqs), len(words))
+        return b"".join((lengths, spells, raw_ids, raw_freqs, words))
+
+    def _decode_records(self, payload, count, has_freq):
+        lengths = self._LENGTHS.unpack_from(payload)
+        pos = self._LENGTHS.size
+        parts = []
+        for length in lengths:
+            parts.append(payload[pos : pos + length])
+            pos += length
+        raw_spells, raw_ids, raw_freqs, raw_words = parts
+        if count == 0:
+            return []
+        spells = raw_spells.decode("utf8").split("\0")
+        words = raw_words.decode("utf8").split("\0")
+        ids, freqs = array("I"), array("H")
+        ids.frombytes(raw_ids)
+        freqs.frombytes(raw_freqs)
+        if sys.byteorder == "big":
+            ids.byteswap()
+            freqs.byteswap()
+        if len(words) != count or len(ids) != count:
+            raise ValueError("cache entry is truncated")
+        full_spells = map(spells.__getitem__, ids)
+        if has_freq:
+            return list(zip(words, full_spells, map(str, freqs)))
+        return list(zip(words, full_spells))
+
+    def entries(self):
+        """
+        返回缓存条目的列表，每个条目为 (键, 文件大小, 最近使用时间, 元信息)，按最近使用时间从旧到新排序。
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+                with open(path, "rb") as fp:
+                    info = self._read_info(fp)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+                info = {"error": str(e) or type(e).__name__}
+            entries.append((name[: -len(self.SUFFIX)], stat.st_size, stat.st_mtime, info))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def prune(self, max_size):
+        """
+        先删除损坏的条目，再按最近使用时间淘汰条目，直到缓存总大小不超过 max_size，返回被删除的条目数量。
+        """
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        removed = 0
+        # 损坏的条目排在最前面，无论缓存大小是否超过 max_size 都会被删除
+        entries.sort(key=lambda entry: "error" not in entry[3])
+        for key, size, _, info in entries:
+            if total <= max_size and "error" not in info:
+                break
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                LOGGER.warning("无法删除解析缓存条目：%s，%s", key, e)
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            LOGGER.info("解析缓存淘汰条目 %d 个。", removed)
+        return removed
 
 
 def to_raw_txt(records):
@@ -263,59 +1823,609 @@ def to_raw_txt(records):
     return "\n".join(lines)
 
 
+def raw_lines(records):
+    return map("\t".join, records)
+
+
 def writeout(output, raw_txt):
     LOGGER.info("写入文件：%s", output)
     with open(output, "w", encoding="utf8", newline="\n") as ofp:
         ofp.write(raw_txt)
 
 
-def process_raw_txt(scel, output, use_ext_as_frequency):
-    meta, records = read_scel(scel, use_ext_as_frequency)
+WRITE_CHUNK_LINES = 4096
+
+
+def writeout_lines(output, lines):
+    """
+    逐块写出文本行，行之间以换行分隔，内容与 writeout(output, "\\n".join(lines)) 一致。
+    """
+    LOGGER.info("写入文件：%s", output)
+    lines = iter(lines)
+    with open(output, "w", encoding="utf8", newline="\n") as ofp:
+        sep = ""
+        while True:
+            chunk = list(itertools.islice(lines, WRITE_CHUNK_LINES))
+            if not chunk:
+                break
+            ofp.write(sep)
+            ofp.write("\n".join(chunk))
+            sep = "\n"
+
+
+def process_raw_txt(
+    scel, output, use_ext_as_frequency, parser="stream", keep_records=True, cache=None, dedup=None
+):
+    """
+    转写细胞词库为文本文件。记录以流的方式写出；keep_records 为 False 时不保留记录，返回 None，
+    否则返回全部记录（见 read_records）。dedup（InFileDedup）不为 None 时先去除文件内重复的记录。
+    """
+    meta, records = iter_scel(scel, use_ext_as_frequency, parser, cache)
+    if keep_records or PROFILE is not None:
+        # 剖析时先完整解析，词组表、去重和写出分别计时
+        records = read_records(records)
+        if dedup is not None:
+            records = dedup_records(dedup, records)
+    elif dedup is not None:
+        records = dedup(records)
     output = output or meta.title + ".txt"
-    raw_txt = to_raw_txt(records)
-    writeout(output, raw_txt)
+    write_records(output, records)
+    return records if keep_records else None
+
+
+# 为 True 时以 RecordTable 保留记录（--compact-records）：峰值内存约为元组列表的一半，
+# 但构造表和每次遍历都要重新编码、解码词语，转写更慢，所以默认使用元组列表
+COMPACT_RECORDS = False
+
+
+def read_records(records):
+    """
+    读取全部记录，COMPACT_RECORDS 为 True 时返回 RecordTable，否则返回元组列表。
+    """
+    if isinstance(records, RecordTable):
+        # parallel 解析方式返回的 RecordTable 已经在 read_word_table_parallel 的 word_table 阶段中计时和计数
+        return records
+    with profile_stage("word_table") as stage:
+        records = _collect_records(records)
+        stage["records"] += len(records)
     return records
 
 
-def process_rime_dict(dict_name, rime_dir, records, header):
+def dedup_records(dedup, records):
+    """
+    在 dedup 阶段用 dedup（InFileDedup）去除文件内重复的记录，返回值与 read_records 相同。
+    records 应当已经由 read_records 读取，这样 word_table 阶段统计的是去重之前解析出的记录数。
+    """
+    with profile_stage("dedup") as stage:
+        records = _collect_records(dedup(records))
+        stage["records"] += len(records)
+    return records
+
+
+def _collect_records(records):
+    if not isinstance(records, (RecordTable, list)):
+        records = RecordTable.from_records(records) if COMPACT_RECORDS else list(records)
+    return records
+
+
+def write_records(output, records, header=None):
+    with profile_stage("writeout") as stage:
+        lines = raw_lines(records)
+        writeout_lines(output, lines if header is None else itertools.chain([header], lines))
+        if hasattr(records, "__len__"):
+            stage["records"] += len(records)
+        stage["bytes_written"] += os.path.getsize(output)
+
+
+def process_rime_dict(dict_name, rime_dir, records, header, index=None):
+    """
+    去掉 cn_dicts 中已收录的词语后写出 Rime 词典，返回新增的词语数量。
+    """
     LOGGER.debug("Rime 用户文件夹：%s", rime_dir)
     full_path, cn_dicts = make_path(dict_name, rime_dir)
-    uniq_words = unique_words(cn_dicts, records)
+    with profile_stage("unique_words") as stage:
+        dict_bytes_read = COUNTERS["dict_bytes_read"]
+        uniq_words = unique_words(cn_dicts, records, index)
+        stage["records"] += len(records)
+        stage["bytes_read"] += COUNTERS["dict_bytes_read"] - dict_bytes_read
     if len(uniq_words) == 0:
         LOGGER.warning("所有词语都已被收录，跳过。")
-        return
+        return 0
     LOGGER.info("新增词语 %d 个。", len(uniq_words))
-    raw_txt = to_raw_txt(uniq_words)
-    dict_content = header + "\n" + raw_txt
-    writeout(full_path, dict_content)
+    write_records(full_path, uniq_words, header)
+    if index is not None:
+        index.add_file(full_path, (record[0] for record in uniq_words))
     LOGGER.info("++-------------------------------------------++")
     LOGGER.info("|| 词典文件已经写入，请挂载后重新部署 Rime。 ||")
     LOGGER.info("++-------------------------------------------++")
+    return len(uniq_words)
+
+
+class BatchResult:
+    def __init__(
+        self,
+        scel,
+        output,
+        title=None,
+        word_cnt=0,
+        seconds=0.0,
+        records=None,
+        error=None,
+        profile=None,
+        duplicates=0,
+        spell_memo=(0, 0),
+        counters=None,
+    ) -> None:
+        self.scel = scel
+        self.output = output
+        self.title = title
+        self.word_cnt = word_cnt
+        self.seconds = seconds
+        self.records = records
+        self.error = error
+        # 开启 --profile 或 --metrics 时工作进程中记录的 StageProfile，由主进程合并
+        self.profile = profile
+        # 开启 --dedup 时去除的文件内重复记录数
+        self.duplicates = duplicates
+        # 转写这个文件时全拼缓存的 (命中, 未命中) 次数，工作进程中的次数由主进程合并到 SPELL_MEMO
+        self.spell_memo = spell_memo
+        # 转写这个文件时 COUNTERS 的增量，工作进程中的计数由主进程合并到 COUNTERS
+        self.counters = counters if counters is not None else Counter()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self) -> str:
+        if not self.ok:
+            return "{}：失败，{}".format(self.scel, self.error)
+        if self.duplicates:
+            return "{}：{} 个词语（去除文件内重复 {} 条），耗时 {:.3f} 秒".format(
+                self.scel, self.word_cnt, self.duplicates, self.seconds
+            )
+        return "{}：{} 个词语，耗时 {:.3f} 秒".format(self.scel, self.word_cnt, self.seconds)
+
+
+def collect_scel_files(paths):
+    """
+    展开批量转写的输入。目录会展开为其中所有的 .scel 文件，其它输入按通配符展开。
+    结果保持输入顺序并去除重复文件。输出文件和 Rime 词典按文件名命名，
+    不同目录中的同名文件会互相覆盖，所以遇到同名文件时直接报错。
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matched = glob.glob(os.path.join(glob.escape(path), "*.scel"))
+        elif os.path.isfile(path):
+            matched = [path]
+        else:
+            matched = glob.glob(path)
+        if not matched:
+            LOGGER.warning("没有找到细胞词库文件：%s", path)
+        files.extend(sorted(matched))
+    files = list(dict.fromkeys(files))
+
+    stems = {}
+    for scel in files:
+        stems.setdefault(os.path.splitext(os.path.basename(scel))[0], []).append(scel)
+    collisions = [paths for paths in stems.values() if len(paths) > 1]
+    if collisions:
+        raise ValueError(
+            "批量转写的输入中有同名的细胞词库文件，输出会互相覆盖：{}".format(
+                "；".join("、".join(paths) for paths in collisions)
+            )
+        )
+    return files
+
+
+def convert_one(
+    scel, output, use_ext_as_frequency, parser="stream", keep_records=False, cache=None, profile=None, dedup=None
+):
+    """
+    转写单个细胞词库，供批量转写的工作进程调用。异常会被记录在结果中，不会中断整个批次。
+
+    profile 为主进程 PROFILE.clone() 的结果。在工作进程中运行时（包括 fork 继承了主进程 PROFILE 的情况），
+    各阶段记录在 profile 中并随 BatchResult 返回；在主进程中运行时直接记录到 PROFILE。
+    """
+    global PROFILE
+
+    own_profile = profile is not None and (PROFILE is None or PROFILE.pid != os.getpid())
+    if own_profile:
+        PROFILE = profile
+        PROFILE.pid = os.getpid()
+    local_profile = PROFILE if own_profile else None
+    counters = COUNTERS.copy()
+    memo_hits, memo_misses = SPELL_MEMO.hits, SPELL_MEMO.misses
+    start = time.perf_counter()
+    try:
+        with profile_span("convert", scel=scel):
+            meta, records = iter_scel(scel, use_ext_as_frequency, parser, cache)
+            records = read_records(records)
+            if dedup is not None:
+                records = dedup_records(dedup, records)
+            write_records(output, records)
+    except Exception as e:
+        # 损坏的细胞词库也可能引发 IndexError、AssertionError 等意料之外的异常，同样只让这个文件失败
+        if isinstance(e, (OSError, ValueError, struct.error, UnicodeDecodeError)):
+            LOGGER.error("转写失败：%s，%s", scel, e)
+        else:
+            LOGGER.exception("转写异常：%s", scel)
+        if PROFILE is not None:
+            PROFILE.failed("convert", e)
+        return BatchResult(
+            scel,
+            output,
+            seconds=time.perf_counter() - start,
+            error=repr(e),
+            profile=local_profile,
+            spell_memo=(SPELL_MEMO.hits - memo_hits, SPELL_MEMO.misses - memo_misses),
+            counters=COUNTERS - counters,
+        )
+    finally:
+        if own_profile:
+            PROFILE = None
+    return BatchResult(
+        scel,
+        output,
+        title=meta.title,
+        word_cnt=len(records),
+        seconds=time.perf_counter() - start,
+        records=records if keep_records else None,
+        profile=local_profile,
+        duplicates=COUNTERS["infile_duplicates"] - counters["infile_duplicates"],
+        spell_memo=(SPELL_MEMO.hits - memo_hits, SPELL_MEMO.misses - memo_misses),
+        counters=COUNTERS - counters,
+    )
+
+
+def convert_batch(
+    scels, output_dir, use_ext_as_frequency, parser="stream", keep_records=False, jobs=None, cache=None, dedup=None
+):
+    """
+    使用进程池批量转写细胞词库，按输入顺序逐个产出 BatchResult。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, os.path.splitext(os.path.basename(scel))[0] + ".txt") for scel in scels]
+    jobs = jobs or os.cpu_count() or 1
+    n = len(scels)
+    if parser == "parallel" and jobs > 1 and n > 1:
+        # 文件之间已经并行，不再在文件内部启动进程池
+        parser = "mmap"
+    options = (
+        itertools.repeat(use_ext_as_frequency, n),
+        itertools.repeat(parser, n),
+        itertools.repeat(keep_records, n),
+        itertools.repeat(cache, n),
+        itertools.repeat(PROFILE.clone() if PROFILE is not None else None, n),
+        itertools.repeat(dedup, n),
+    )
+    if jobs == 1 or n <= 1:
+        yield from map(convert_one, scels, outputs, *options)
+        return
+    with process_pool(min(jobs, n)) as executor:
+        for result in executor.map(convert_one, scels, outputs, *options):
+            SPELL_MEMO.record(*result.spell_memo)
+            COUNTERS.update(result.counters)
+            yield result
+
+
+def open_parse_cache(args):
+    if args.cache_dir:
+        return ParseCache(args.cache_dir, args.cache_max_size * (1 << 20))
+    return None
+
+
+def in_file_dedup(args):
+    if args.dedup:
+        return InFileDedup(args.dedup, args.dedup_keep)
+    return None
+
+
+def open_word_index(args):
+    # 监视模式总是使用词语索引，每个新文件去重时只需要重新解析发生变化的词典
+    if args.rime_dir and (args.word_index or args.watch):
+        return WordIndex.for_rime_dir(args.rime_dir)
+    return None
+
+
+def result_dict_name(args, scel):
+    stem = os.path.splitext(os.path.basename(scel))[0]
+    return "{}.{}".format(args.dict_name, stem) if args.dict_name else stem
+
+
+def write_result_rime_dict(args, result, index=None):
+    """
+    为批量转写或监视模式的一个结果生成 Rime 词典，字典名称为 '--dict-name' 前缀加细胞词库文件名。
+    """
+    dict_name = result_dict_name(args, result.scel)
+    header = read_header(result.scel, dict_name, args.header)
+    process_rime_dict(dict_name, args.rime_dir, result.records, header, index)
+    result.records = None
+
+
+def process_batch(args, index=None):
+    scels = collect_scel_files(args.batch)
+    if not scels:
+        raise ValueError("没有需要转写的细胞词库文件。")
+    LOGGER.info("批量转写 %d 个细胞词库文件。", len(scels))
+
+    start = time.perf_counter()
+    results = []
+    for result in convert_batch(
+        scels,
+        args.output_dir,
+        args.use_ext_as_frequency,
+        args.parser,
+        keep_records=bool(args.rime_dir),
+        jobs=args.jobs,
+        cache=open_parse_cache(args),
+        dedup=in_file_dedup(args),
+    ):
+        LOGGER.info("%s", result)
+        if PROFILE is not None and result.profile is not None:
+            PROFILE.merge(result.profile)
+        if result.ok and args.rime_dir:
+            # 去重依赖之前写入的词典，所以 Rime 词典在主进程中按顺序生成
+            write_result_rime_dict(args, result, index)
+        results.append(result)
+
+    failed = sum(1 for result in results if not result.ok)
+    LOGGER.info(
+        "批量转写完成：成功 %d 个，失败 %d 个，共 %d 个词语，去除文件内重复 %d 条，耗时 %.3f 秒。",
+        len(results) - failed,
+        failed,
+        sum(result.word_cnt for result in results),
+        sum(result.duplicates for result in results),
+        time.perf_counter() - start,
+    )
+    return results
+
+
+WATCH_INTERVAL = 1.0
+WATCH_SETTLE = 2.0
+# 监视模式下 '--chrome-trace' 只保留最近的这么多个事件
+WATCH_TRACE_EVENTS = 1 << 20
+
+
+class SpoolWatcher:
+    """
+    轮询目录中的 .scel 文件。文件的大小和修改时间在 settle 秒内保持不变才视为写入完成，
+    避免转写下载到一半的文件；同一个文件的大小或修改时间再次变化后会重新转写。
+    """
+
+    def __init__(self, directory, settle=WATCH_SETTLE) -> None:
+        self.directory = directory
+        self.settle = settle
+        # 路径 -> 已转写时的 (大小, 修改时间)
+        self._done = {}
+        # 路径 -> (最近一次看到的 (大小, 修改时间), 看到该状态的时间)
+        self._pending = {}
+
+    def mark_done(self, path, key):
+        self._done[path] = key
+
+    def ready(self):
+        """
+        扫描一次目录，返回已经写入完成、尚未转写的 [(路径, (大小, 修改时间))]，按文件名排序。
+        """
+        now = time.monotonic()
+        ready = []
+        present = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(".scel"):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # 扫描期间被删除或改名
+                    continue
+                present.add(entry.path)
+                key = (stat.st_size, stat.st_mtime_ns)
+                if self._done.get(entry.path) == key:
+                    continue
+                seen = self._pending.get(entry.path)
+                if seen is None or seen[0] != key:
+                    self._pending[entry.path] = (key, now)
+                elif now - seen[1] >= self.settle:
+                    del self._pending[entry.path]
+                    ready.append((entry.path, key))
+        for path in self._pending.keys() - present:
+            del self._pending[path]
+        for path in self._done.keys() - present:
+            del self._done[path]
+        return sorted(ready)
+
+
+def watch_output(args, scel):
+    return os.path.join(args.output_dir, os.path.splitext(os.path.basename(scel))[0] + ".txt")
+
+
+def watch_converted(args, entry):
+    """
+    重启后判断 entry 是否已经转写过：输出文件不比细胞词库旧，指定 '--rime-dir' 时 Rime 词典也不比它旧。
+    已转写过时返回细胞词库的 (大小, 修改时间)，否则返回 None。
+
+    所有词语都已被收录时不会生成 Rime 词典，这样的文件重启后会再转写一次。
+    """
+    outputs = [watch_output(args, entry.path)]
+    if args.rime_dir:
+        dict_name = result_dict_name(args, entry.path)
+        outputs.append(os.path.join(args.rime_dir, "cn_dicts", dict_name + ".dict.yaml"))
+    try:
+        stat = entry.stat()
+        if all(os.stat(output).st_mtime_ns >= stat.st_mtime_ns for output in outputs):
+            return (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def watch_convert(args, scel, index, cache, dedup):
+    """
+    转写监视目录中的一个文件，指定 '--rime-dir' 时接着生成 Rime 词典。返回是否成功，失败不会中断监视。
+    """
+    result = convert_one(
+        scel,
+        watch_output(args, scel),
+        args.use_ext_as_frequency,
+        args.parser,
+        keep_records=bool(args.rime_dir),
+        cache=cache,
+        dedup=dedup,
+    )
+    LOGGER.info("%s", result)
+    if not result.ok or not args.rime_dir:
+        return result.ok
+    try:
+        write_result_rime_dict(args, result, index)
+    except (OSError, ValueError, struct.error, sqlite3.Error) as e:
+        LOGGER.error("生成 Rime 词典失败：%s，%s", scel, e)
+        if PROFILE is not None:
+            PROFILE.failed("rime_dict", e)
+        return False
+    return True
+
+
+def process_watch(args, index=None):
+    """
+    监视 '--watch' 目录，转写新出现或发生变化的细胞词库文件，直到被中断（Ctrl-C）。
+
+    词语索引、词典头模板和全拼缓存在整个进程中只加载一次。输出文件（以及 Rime 词典）比细胞词库新的文件
+    视为已经转写过，重启后不会重复转写。转写或生成 Rime 词典失败的文件在再次变化后重试。
+    """
+    watcher = SpoolWatcher(args.watch, args.watch_settle)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with os.scandir(args.watch) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(".scel"):
+                key = watch_converted(args, entry)
+                if key is not None:
+                    watcher.mark_done(entry.path, key)
+    LOGGER.info("监视目录：%s，每 %.1f 秒检查一次。", args.watch, args.watch_interval)
+    cache, dedup = open_parse_cache(args), in_file_dedup(args)
+    converted = 0
+    try:
+        while True:
+            for scel, key in watcher.ready():
+                converted += watch_convert(args, scel, index, cache, dedup)
+                # Rime 词典写完后才标记，失败的文件同样标记为已处理，文件再次变化时才重试
+                watcher.mark_done(scel, key)
+                if args.metrics:
+                    write_metrics(args.metrics, PROFILE, not PROFILE.failures)
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        LOGGER.info("停止监视，共转写 %d 个文件。", converted)
+    return converted
 
 
 def check_args(args):
+    if args.jobs is not None and args.jobs < 1:
+        raise ValueError("'--jobs' 必须大于 0。")
+    if args.header and not os.path.isfile(args.header):
+        raise ValueError("词典头模板不存在：{}".format(args.header))
+    if args.profile_dump and not args.profile:
+        raise ValueError("'--profile-dump' 需要同时指定 '--profile'。")
+    if args.profile_dump and args.batch and args.jobs != 1:
+        # 批量转写在工作进程中完成，主进程的 cProfile 剖析不到任何阶段
+        raise ValueError("批量转写时 '--profile-dump' 需要同时指定 '--jobs 1'。")
+    if args.dedup_keep == "max-freq" and args.dedup and not args.use_ext_as_frequency:
+        raise ValueError("'--dedup-keep max-freq' 需要同时指定 '--use-ext-as-frequency'。")
+    if args.trace_block_group < 0:
+        raise ValueError("'--trace-block-group' 不能小于 0。")
+    if args.watch:
+        if not os.path.isdir(args.watch):
+            raise ValueError("监视的目录不存在：{}".format(args.watch))
+        if args.watch_interval <= 0 or args.watch_settle < 0:
+            raise ValueError("'--watch-interval' 必须大于 0，'--watch-settle' 不能小于 0。")
+        return
+    if args.batch:
+        return
     if not os.path.exists(args.scel):
-        raise ValueError("文件不存在：{}".format(args.scel_file))
+        raise ValueError("文件不存在：{}".format(args.scel))
     if args.rime_dir and not args.dict_name:
         raise ValueError("当 '--rime-dir' 不为空时，'--dict-name' 不可为空。")
 
 
 def process(args):
-    check_args(args)
-    scel, output, use_ext_as_frequency = (
+    global COMPACT_RECORDS, PARALLEL_JOBS, PROFILE
+
+    if args.trace:
+        LOGGER.setLevel(TRACE)
+    SPELL_MEMO.maxsize = args.spell_memo_size
+    COMPACT_RECORDS = args.compact_records
+    PARALLEL_JOBS = args.jobs
+    if args.profile or args.metrics or args.chrome_trace:
+        hot_stage = args.profile_stage if args.profile_dump else None
+        # 监视模式长时间运行，只保留最近的 trace 事件
+        max_events = WATCH_TRACE_EVENTS if args.watch else None
+        PROFILE = StageProfile(
+            hot_stage, trace=bool(args.chrome_trace), block_group=args.trace_block_group, max_events=max_events
+        )
+    index = None
+    success = False
+    try:
+        # 参数错误（例如文件不存在）也计入失败次数
+        check_args(args)
+        index = open_word_index(args)
+        result = _process(args, index)
+        success = True
+        return result
+    except Exception as e:
+        if PROFILE is not None:
+            PROFILE.failed("process", e)
+        raise
+    finally:
+        if index is not None:
+            index.close()
+        COUNTERS["spell_memo_hits"] = SPELL_MEMO.hits
+        COUNTERS["spell_memo_misses"] = SPELL_MEMO.misses
+        LOGGER.info("全拼缓存：%s", SPELL_MEMO)
+        LOGGER.debug("计数器：%s", dict(COUNTERS))
+        if args.profile:
+            PROFILE.write(args.profile, args.profile_dump)
+        if args.metrics:
+            write_metrics(args.metrics, PROFILE, success and not PROFILE.failures)
+        if args.chrome_trace:
+            PROFILE.write_trace(args.chrome_trace)
+
+
+def _process(args, index):
+    if args.watch:
+        return process_watch(args, index)
+    if args.batch:
+        return process_batch(args, index)
+    scel, output, use_ext_as_frequency, parser = (
         args.scel,
         args.output,
         args.use_ext_as_frequency,
+        args.parser,
+    )
+    # 只有生成 Rime 词典时才需要保留全部记录用于去重
+    records = process_raw_txt(
+        scel,
+        output,
+        use_ext_as_frequency,
+        parser,
+        keep_records=bool(args.rime_dir),
+        cache=open_parse_cache(args),
+        dedup=in_file_dedup(args),
     )
-    records = process_raw_txt(scel, output, use_ext_as_frequency)
 
     if not args.rime_dir:
         return
 
     rime_dir, dict_name = args.rime_dir, args.dict_name
-    header = read_header(scel, dict_name)
-    process_rime_dict(dict_name, rime_dir, records, header)
+    header = read_header(scel, dict_name, args.header)
+    process_rime_dict(dict_name, rime_dir, records, header, index)
 
 
 if __name__ == "__main__":
-    process(args())
+    simple_logger()
+    options = args()
+    results = process(options)
+    # 批量转写中有文件失败时以非零状态退出，便于定时任务发现问题
+    if options.batch and not all(result.ok for result in results):
+        sys.exit(1)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+搜狗细胞词库写入工具，生成的文件可以被 scel_transfer 解析，用于测试和压力测试。
+
+文件格式见 scel_transfer 中的 get_dict_meta、syllable_table 和 iter_word_table。
+"""
+
+import argparse
+import itertools
+import random
+import struct
+
+from scel_transfer import HZ_OFFSETS, DictMeta
+
+# 元信息各字段在文件中的区间，与 scel_transfer.get_dict_meta 一致
+META_REGIONS = (
+    ("title", 0x130, 0x338),
+    ("category", 0x338, 0x540),
+    ("desc", 0x540, 0xD40),
+    ("samples", 0xD40, 0x1540),
+)
+SYLLABLE_TABLE_OFFSET = 0x1540
+
+_INITIALS = ("",) + tuple("b p m f d t n l g k h j q x zh ch sh r z c s".split())
+_FINALS = ("a", "o", "e", "ai", "ei", "ao", "ou", "an", "en", "ang", "eng", "ong", "i", "u")
+# 默认音节表。scel_transfer.syllable_table 以 zuo 作为音节表的结束标志，所以 zuo 必须是最后一个音节
+DEFAULT_SYLLABLES = tuple(initial + final for initial in _INITIALS for final in _FINALS) + ("zuo",)
+
+WRITE_BUFFER_SIZE = 1 << 20
+_UINT16_MAX = 0xFFFF
+
+
+def _utf16(text):
+    return text.encode("UTF-16LE")
+
+
+def make_header(meta, syllables=DEFAULT_SYLLABLES, mask=0x44):
+    """
+    生成汉语词组表之前的全部内容：文件头 mask、元信息和音节表。
+    """
+    if mask not in HZ_OFFSETS:
+        raise ValueError("unknown mask: {}".format(mask))
+    if not syllables or syllables[-1] != "zuo" or "zuo" in syllables[:-1]:
+        raise ValueError("音节表必须以 'zuo' 结尾，且只能包含一个 'zuo'。")
+
+    data = bytearray(HZ_OFFSETS[mask])
+    data[4] = mask
+    for field, start, end in META_REGIONS:
+        raw = _utf16(getattr(meta, field))
+        if len(raw) > end - start:
+            raise ValueError("元信息 {} 过长：{} 字节，最多 {} 字节。".format(field, len(raw), end - start))
+        data[start : start + len(raw)] = raw
+
+    pos = SYLLABLE_TABLE_OFFSET + 4
+    struct.pack_into("<H", data, SYLLABLE_TABLE_OFFSET, len(syllables))
+    for index, syllable in enumerate(syllables):
+        raw = _utf16(syllable)
+        if pos + 4 + len(raw) > len(data):
+            raise ValueError("音节表超出了汉语词组表的偏移：{:#x}".format(len(data)))
+        struct.pack_into("<HH", data, pos, index, len(raw))
+        data[pos + 4 : pos + 4 + len(raw)] = raw
+        pos += 4 + len(raw)
+    return data
+
+
+def encode_block(syllable_indices, words):
+    """
+    编码一个同音词块。words 是 (词语, 词频) 的列表，词频写入扩展信息的第一个整数。
+    """
+    if len(words) > _UINT16_MAX:
+        raise ValueError("同音词数量过多：{}".format(len(words)))
+    block = bytearray(struct.pack("<HH", len(words), 2 * len(syllable_indices)))
+    block += struct.pack("<{}H".format(len(syllable_indices)), *syllable_indices)
+    for word, freq in words:
+        raw = _utf16(word)
+        if len(raw) > _UINT16_MAX:
+            raise ValueError("词语过长：{}".format(word))
+        block += struct.pack("<H", len(raw)) + raw
+        # ext_len 固定为 10，ext 的前两个字节为词频，后八个字节为 0
+        block += struct.pack("<HH", 10, freq) + bytes(8)
+    return block
+
+
+def records_to_blocks(records, syllables=DEFAULT_SYLLABLES):
+    """
+    把 scel_transfer 产出的记录 (词语, 全拼[, 词频]) 转换为同音词块，全拼相同的连续记录合并为一个块。
+    """
+    syllable_index = {syllable: index for index, syllable in enumerate(syllables)}
+    for full_spell, group in itertools.groupby(records, key=lambda record: record[1]):
+        try:
+            indices = [syllable_index[syllable] for syllable in full_spell.split(" ")]
+        except KeyError as e:
+            raise ValueError("音节表中没有音节：{}".format(e.args[0]))
+        words = [(record[0], int(record[2]) if len(record) > 2 else 0) for record in group]
+        for i in range(0, len(words), _UINT16_MAX):
+            yield indices, words[i : i + _UINT16_MAX]
+
+
+def write_scel(path, meta, blocks, syllables=DEFAULT_SYLLABLES, mask=0x44):
+    """
+    流式写出细胞词库。blocks 是 (音节索引列表, [(词语, 词频), ...]) 的可迭代对象，逐块编码写出，
+    不会在内存中保留整个文件。返回写出的词语数量。
+    """
+    word_cnt = 0
+    with open(path, "wb", buffering=WRITE_BUFFER_SIZE) as fp:
+        fp.write(make_header(meta, syllables, mask))
+        for indices, words in blocks:
+            fp.write(encode_block(indices, words))
+            word_cnt += len(words)
+    return word_cnt
+
+
+def synthetic_blocks(word_count, syllable_cnt=len(DEFAULT_SYLLABLES), seed=0, max_syllables=4, max_homophones=3):
+    """
+    生成 word_count 个随机词语组成的同音词块，相同的参数产生相同的结果。
+    """
+    rnd = random.Random(seed)
+    written = 0
+    while written < word_count:
+        length = rnd.randint(1, max_syllables)
+        indices = [rnd.randrange(syllable_cnt) for _ in range(length)]
+        homophones = min(rnd.randint(1, max_homophones), word_count - written)
+        words = [
+            ("".join(chr(rnd.randint(0x4E00, 0x9FA5)) for _ in range(length)), rnd.randint(1, _UINT16_MAX))
+            for _ in range(homophones)
+        ]
+        written += homophones
+        yield indices, words
+
+
+def write_synthetic_scel(path, word_count, mask=0x44, seed=0, title=None):
+    """
+    写出包含 word_count 个随机词语的细胞词库。
+    """
+    meta = DictMeta(title or "合成词库", "测试", "随机生成的细胞词库", "无")
+    return write_scel(path, meta, synthetic_blocks(word_count, seed=seed), mask=mask)
+
+
+def args():
+    ap = argparse.ArgumentParser(description="生成随机的搜狗细胞词库，用于测试和压力测试。")
+    ap.add_argument("--output", "-o", type=str, required=True, help="输出的细胞词库文件。")
+    ap.add_argument("--words", "-n", type=int, required=True, help="词语数量。")
+    ap.add_argument(
+        "--mask",
+        type=lambda x: int(x, 0),
+        choices=sorted(HZ_OFFSETS),
+        default=0x44,
+        help="文件头类型，0x44 或 0x45，默认 0x44。",
+    )
+    ap.add_argument("--seed", type=int, default=0, help="随机数种子，默认 0。")
+    ap.add_argument("--title", type=str, required=False, help="词库标题。")
+    return ap.parse_args()
+
+
+if __name__ == "__main__":
+    a = args()
+    write_synthetic_scel(a.output, a.words, a.mask, a.seed, a.title)
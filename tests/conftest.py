@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的夹具：用 scel_writer 生成合成细胞词库。
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scel_writer import write_synthetic_scel  # noqa: E402
+
+WORD_COUNT = 3000
+
+
+@pytest.fixture(params=[0x44, 0x45])
+def scel(request, tmp_path):
+    path = str(tmp_path / "synthetic.scel")
+    write_synthetic_scel(path, WORD_COUNT, mask=request.param, seed=7)
+    return path
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    """
+    合成词库很小，降低阈值使 parallel 真正启动进程池。
+    """
+    import scel_transfer
+
+    monkeypatch.setattr(scel_transfer, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(scel_transfer, "PARALLEL_JOBS", 2)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+批量转写：输入展开、同名文件检查、退出状态，以及工作进程中的计数合并到主进程。
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import scel_transfer
+from conftest import ROOT
+from scel_writer import write_synthetic_scel
+
+SCEL_TRANSFER = os.path.join(ROOT, "scel_transfer.py")
+
+
+def run(*argv, cwd):
+    cmd = [sys.executable, SCEL_TRANSFER, *argv]
+    return subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+@pytest.fixture
+def dicts(tmp_path):
+    """
+    两个目录，各有两个互不同名的合成词库。
+    """
+    paths = []
+    for i, name in enumerate(["d1/a.scel", "d1/b.scel", "d2/c.scel", "d2/d.scel"]):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        write_synthetic_scel(str(path), 500, seed=i)
+        paths.append(str(path))
+    return paths
+
+
+def test_collect_scel_files(dicts, tmp_path):
+    d1, d2 = str(tmp_path / "d1"), str(tmp_path / "d2")
+    files = scel_transfer.collect_scel_files([d2, os.path.join(d1, "*.scel"), dicts[2]])
+    assert files == [dicts[2], dicts[3], dicts[0], dicts[1]]
+
+
+def test_collect_scel_files_rejects_colliding_names(dicts, tmp_path):
+    duplicate = tmp_path / "d2" / "a.scel"
+    write_synthetic_scel(str(duplicate), 10)
+    with pytest.raises(ValueError, match="a.scel"):
+        scel_transfer.collect_scel_files([str(tmp_path / "d1"), str(tmp_path / "d2")])
+
+    proc = run("-b", "d1", "d2", "--output-dir", "out", cwd=tmp_path)
+    assert proc.returncode != 0
+    assert not (tmp_path / "out").exists()
+
+
+def test_batch_exit_status(dicts, tmp_path):
+    proc = run("-b", "d1", "--output-dir", "out", cwd=tmp_path)
+    assert proc.returncode == 0
+    assert sorted(os.listdir(tmp_path / "out")) == ["a.txt", "b.txt"]
+
+    (tmp_path / "d1" / "bad.scel").write_bytes(b"\0" * 16)
+    proc = run("-b", "d1", "--output-dir", "out", cwd=tmp_path)
+    assert proc.returncode == 1
+    assert "bad.scel" in proc.stderr.decode("utf8")
+
+
+def test_batch_merges_worker_counters(dicts, tmp_path):
+    argv = ["-b", "d1", "d2", "--output-dir", "out", "-j", "2", "--dedup", "word", "--cache-dir", "cache"]
+    argv += ["--profile", "profile.json"]
+    parsed = [scel_transfer.read_scel(scel, False)[1] for scel in dicts]
+    words = sum(map(len, parsed))
+    duplicates = words - sum(len({record[0] for record in records}) for records in parsed)
+    for hits, misses in ((0, len(dicts)), (len(dicts), 0)):
+        proc = run(*argv, cwd=tmp_path)
+        assert proc.returncode == 0, proc.stderr
+        with open(tmp_path / "profile.json", encoding="utf8") as fp:
+            counters = json.load(fp)["counters"]
+        assert counters.get("parse_cache_hits", 0) == hits
+        assert counters.get("parse_cache_misses", 0) == misses
+        assert counters["infile_records"] == words
+        assert counters.get("infile_duplicates", 0) == duplicates
+
+
+def test_batch_profile_dump_requires_single_job(dicts, tmp_path):
+    proc = run("-b", "d1", "--profile", "-", "--profile-dump", "dump.prof", cwd=tmp_path)
+    assert proc.returncode != 0
+    assert "--jobs 1" in proc.stderr.decode("utf8")
+
+    argv = ["-b", "d1", "--output-dir", "out", "-j", "1", "--profile", "-", "--profile-dump", "dump.prof"]
+    proc = run(*argv, cwd=tmp_path)
+    assert proc.returncode == 0
+    assert os.path.getsize(tmp_path / "dump.prof") > 0
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+ParseCache 按内容缓存解析结果，损坏的条目视为未命中并在清理时删除。
+"""
+
+import scel_transfer
+from scel_transfer import ParseCache
+
+
+def test_parse_cache_round_trip(scel, tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    meta, expected = scel_transfer.read_scel(scel, True)
+    key = cache.key(scel, True)
+    assert cache.get(key) is None
+
+    _, records = scel_transfer.iter_scel(scel, True, cache=cache)
+    assert list(records) == expected
+    cached_meta, cached = cache.get(key)
+    assert cached == expected
+    assert cached_meta.title == meta.title
+    assert cache.key(scel, False) != key
+
+
+def test_parse_cache_corrupt_entry(scel, tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    meta, records = scel_transfer.read_scel(scel, False)
+    key = cache.key(scel, False)
+    cache.put(key, meta, records)
+
+    with open(cache.path(key), "r+b") as fp:
+        fp.truncate(10)
+    assert cache.get(key) is None
+    ((entry_key, _, _, info),) = cache.entries()
+    assert entry_key == key and "error" in info
+
+    # 损坏的条目无论缓存是否超过容量都会被删除，之后的转写可以重新写入缓存
+    assert cache.prune(1 << 30) == 1
+    assert cache.entries() == []
+    _, records = scel_transfer.iter_scel(scel, False, cache=cache)
+    assert list(records) == cache.get(key)[1]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+常驻服务的请求处理：转写、按常驻词典去重和查询，错误的请求同样有响应。
+"""
+
+import asyncio
+import json
+import os
+
+import scel_transfer
+from scel_daemon import ConversionServer
+
+
+def test_conversion_server(scel, tmp_path):
+    _, records = scel_transfer.read_scel(scel, True)
+    words = {record[0] for record in records}
+    rime_dir = str(tmp_path / "rime")
+    output = str(tmp_path / "out.txt")
+
+    async def requests(server):
+        convert = {"op": "convert", "scel": scel, "output": output, "use_ext_as_frequency": True}
+        convert.update(rime_dir=rime_dir, dict_name="sogou.first", dedup="word", id=1)
+        first = await server.handle(json.dumps(convert))
+        # 第二次转写时所有词语都已被常驻词典收录
+        convert.update(dict_name="sogou.second", id=2)
+        second = await server.handle(json.dumps(convert))
+        lookup = {"op": "lookup", "rime_dir": rime_dir, "words": [records[0][0], "不存在"]}
+        lookup = await server.handle(json.dumps(lookup))
+        bad = await server.handle(json.dumps({"op": "convert", "scel": str(tmp_path / "missing.scel"), "id": 3}))
+        unknown = await server.handle("[]")
+        stats = await server.handle(json.dumps({"op": "stats"}))
+        return first, second, lookup, bad, unknown, stats
+
+    server = ConversionServer()
+    try:
+        first, second, lookup, bad, unknown, stats = asyncio.run(requests(server))
+    finally:
+        server.close()
+
+    assert first["ok"] and first["id"] == 1
+    assert first["words"] == first["new_words"] == len(words)
+    assert os.path.exists(output)
+    assert os.path.exists(os.path.join(rime_dir, "cn_dicts", "sogou.first.dict.yaml"))
+    assert second["ok"] and second["new_words"] == 0
+    assert lookup["found"] == {records[0][0]: ["sogou.first.dict.yaml"]} and lookup["missing"] == ["不存在"]
+    assert not bad["ok"] and bad["id"] == 3 and "FileNotFoundError" in bad["error"]
+    assert not unknown["ok"]
+    assert stats["requests"] == {"convert": 3, "lookup": 1, "invalid": 1}
+    assert stats["rime_dirs"][os.path.abspath(rime_dir)]["words"] == len(words)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+读取 Rime 词典中的词语，以及 WordIndex 在 cn_dicts 中的文件变化后保持一致。
+"""
+
+import os
+
+import pytest
+
+import scel_transfer
+from scel_transfer import WordIndex
+
+
+def _words_set(path):
+    # 改为流式读取之前 unique_words 中读取词典的实现
+    with open(path, encoding="utf8") as fp:
+        lines = fp.readlines()
+        index = lines.index("...\n")
+        if lines[-1].strip() == "":
+            lines = lines[:-1]
+        return set(map(lambda x: x.split("\t")[0], lines[index + 1 :]))
+
+
+@pytest.mark.parametrize("buffer_size", [64, 1 << 20])
+def test_iter_dict_words_matches_words_set(scel, tmp_path, monkeypatch, buffer_size):
+    _, records = scel_transfer.read_scel(scel, True)
+    path = str(tmp_path / "foo.dict.yaml")
+    scel_transfer.write_records(path, records, scel_transfer.read_header(scel, "foo"))
+    # 很小的缓冲区使记录跨越读取块的边界
+    monkeypatch.setattr(scel_transfer, "DICT_READ_BUFFER_SIZE", buffer_size)
+    assert set(scel_transfer.iter_dict_words(path)) == _words_set(path)
+    assert scel_transfer.read_dict_words(path) == {record[0] for record in records}
+
+
+def _write_dict(cn_dicts, name, words):
+    path = os.path.join(cn_dicts, name + ".dict.yaml")
+    records = [(word, "a", "1") for word in words]
+    scel_transfer.write_records(path, records, header="---\nname: {}\n...".format(name))
+    return path
+
+
+def test_word_index_follows_cn_dicts(tmp_path):
+    cn_dicts = str(tmp_path / "cn_dicts")
+    os.makedirs(cn_dicts)
+    _write_dict(cn_dicts, "a", ["你好", "世界"])
+    b = _write_dict(cn_dicts, "b", ["再见"])
+    queried = ["你好", "世界", "再见", "早上"]
+
+    with WordIndex(str(tmp_path / "words.sqlite3")) as index:
+        index.refresh(cn_dicts)
+        assert index.existing(queried) == {"你好", "世界", "再见"}
+
+        # 修改的文件重新解析，删除的文件从索引中移除
+        _write_dict(cn_dicts, "a", ["你好", "早上"])
+        stat = os.stat(os.path.join(cn_dicts, "a.dict.yaml"))
+        os.utime(os.path.join(cn_dicts, "a.dict.yaml"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        os.remove(b)
+        index.refresh(cn_dicts)
+        assert index.existing(queried) == {"你好", "早上"}
+        assert index.existing(queried) == scel_transfer.existing_words(cn_dicts) & set(queried)
+
+        # add_file 记录新写入的词典，不需要再次 refresh
+        c = _write_dict(cn_dicts, "c", ["再见"])
+        index.add_file(c, {"再见"})
+        assert index.existing(queried) == {"你好", "早上", "再见"}
+
+    # 重新打开后索引仍然有效
+    with WordIndex(str(tmp_path / "words.sqlite3")) as index:
+        index.refresh(cn_dicts)
+        assert index.existing(queried) == {"你好", "早上", "再见"}
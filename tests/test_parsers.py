@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+stream、mmap、parallel 三种解析方式的结果一致，parallel 可以与 '--chrome-trace' 同时使用。
+"""
+
+import json
+import mmap
+
+import pytest
+
+import scel_transfer
+from conftest import WORD_COUNT
+from scel_transfer import RecordTable
+
+
+@pytest.mark.parametrize("use_ext_as_frequency", [False, True])
+def test_parsers_agree(scel, parallel, use_ext_as_frequency):
+    _, expected = scel_transfer.read_scel(scel, use_ext_as_frequency, "stream")
+    assert len(expected) == WORD_COUNT
+    _, mmapped = scel_transfer.read_scel(scel, use_ext_as_frequency, "mmap")
+    assert mmapped == expected
+
+    _, records = scel_transfer.iter_scel(scel, use_ext_as_frequency, "parallel")
+    assert isinstance(records, RecordTable)
+    assert list(records) == expected
+
+
+def test_parallel_parser_with_trace(scel, parallel, monkeypatch, tmp_path):
+    _, expected = scel_transfer.read_scel(scel, True, "stream")
+    profile = scel_transfer.StageProfile(trace=True)
+    monkeypatch.setattr(scel_transfer, "PROFILE", profile)
+    _, records = scel_transfer.iter_scel(scel, True, "parallel")
+    assert list(records) == expected
+
+    waits = [event for event in profile.events if event["name"] == "wait_block_range"]
+    assert waits and all(event["args"]["start"] < event["args"]["stop"] for event in waits)
+    assert profile.stages["word_table"]["calls"] == 1
+    path = str(tmp_path / "trace.json")
+    profile.write_trace(path)
+    with open(path, encoding="utf8") as fp:
+        names = {event["name"] for event in json.load(fp)["traceEvents"]}
+    assert {"word_table", "wait_block_range"} <= names
+
+
+def test_block_group_spans(scel, monkeypatch):
+    profile = scel_transfer.StageProfile(trace=True, block_group=100)
+    monkeypatch.setattr(scel_transfer, "PROFILE", profile)
+    scel_transfer.read_scel(scel, False, "mmap")
+    groups = [event for event in profile.events if event["name"] == "blocks"]
+    with open(scel, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        blocks = scel_transfer.scan_blocks(buf, scel_transfer.get_hz_offset(fp), len(buf))
+    assert [event["args"]["first_block"] for event in groups] == list(range(0, len(blocks), 100))
+    assert sum(event["args"]["blocks"] for event in groups) == len(blocks)
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = str(tmp_path / "short.scel")
+    with open(path, "wb") as fp:
+        fp.write(b"\x40\x15")
+    with pytest.raises(ValueError):
+        scel_transfer.read_scel(path, False)
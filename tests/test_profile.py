@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+'--profile'、'--metrics' 和 '--chrome-trace' 的输出。
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT, WORD_COUNT
+
+SCEL_TRANSFER = os.path.join(ROOT, "scel_transfer.py")
+
+
+def read_metrics(path):
+    metrics = {}
+    with open(path, encoding="utf8") as fp:
+        for line in fp:
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                metrics[name] = float(value)
+    return metrics
+
+
+def test_single_file_outputs(scel, tmp_path):
+    argv = ["-s", scel, "-o", "out.txt", "--dedup", "word"]
+    argv += ["--profile", "profile.json", "--metrics", "run.prom", "--chrome-trace", "trace.json"]
+    subprocess.run([sys.executable, SCEL_TRANSFER, *argv], cwd=tmp_path, check=True, stderr=subprocess.PIPE)
+
+    with open(tmp_path / "profile.json", encoding="utf8") as fp:
+        report = json.load(fp)
+    stages, counters = report["stages"], report["counters"]
+    assert stages["word_table"]["records"] == counters["infile_records"] == WORD_COUNT
+    # dedup 和 writeout 阶段记录的是去重后的记录数
+    assert stages["dedup"]["records"] == stages["writeout"]["records"] == WORD_COUNT - counters["infile_duplicates"]
+
+    metrics = read_metrics(tmp_path / "run.prom")
+    assert metrics["scel_transfer_words_parsed_total"] == WORD_COUNT
+    assert metrics["scel_transfer_files_parsed_total"] == 1
+    assert metrics['scel_transfer_stage_duration_seconds_count{stage="word_table"}'] == 1
+    assert metrics["scel_transfer_last_run_success"] == 1
+
+    with open(tmp_path / "trace.json", encoding="utf8") as fp:
+        events = json.load(fp)["traceEvents"]
+    spans = [event for event in events if event.get("ph") == "X"]
+    assert {"get_hz_offset", "syllable_table", "word_table", "writeout"} <= {event["name"] for event in spans}
+
+
+def test_batch_failure_metrics(scel, tmp_path):
+    bad = tmp_path / "bad.scel"
+    bad.write_bytes(b"\0" * 16)
+    argv = ["-b", scel, str(bad), "--output-dir", "out", "-j", "1", "--metrics", "run.prom"]
+    proc = subprocess.run([sys.executable, SCEL_TRANSFER, *argv], cwd=tmp_path, stderr=subprocess.PIPE)
+    assert proc.returncode == 1
+
+    metrics = read_metrics(tmp_path / "run.prom")
+    failures = {name: value for name, value in metrics.items() if name.startswith("scel_transfer_failures_total")}
+    assert list(failures.values()) == [1] and 'type="ValueError"' in next(iter(failures))
+    assert metrics["scel_transfer_words_parsed_total"] == WORD_COUNT
+    assert metrics["scel_transfer_last_run_success"] == 0
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+RecordTable 与记录列表等价，InFileDedup 按词语或 (词语, 全拼) 去除文件内重复的记录。
+"""
+
+from collections import Counter
+
+import pytest
+
+import scel_transfer
+from scel_transfer import InFileDedup, RecordTable
+
+
+def test_record_table_round_trip(scel):
+    _, records = scel_transfer.read_scel(scel, True)
+    table = RecordTable.from_records(records)
+    assert len(table) == len(records)
+    assert list(table) == records
+    assert [table[i] for i in (0, len(records) // 2, len(records) - 1)] == [
+        records[0],
+        records[len(records) // 2],
+        records[-1],
+    ]
+    assert list(table.words()) == [record[0] for record in records]
+
+    half = len(records) // 2
+    parts = [RecordTable.from_records(records[:half]), RecordTable.from_records(records[half:])]
+    concat = RecordTable.concat(parts, True)
+    assert list(concat) == records
+
+    dropped = {record[0] for record in records[::3]}
+    assert list(table.without(dropped)) == [record for record in records if record[0] not in dropped]
+
+    no_freq = [record[:2] for record in records]
+    assert list(RecordTable.from_records(no_freq)) == no_freq
+
+
+RECORDS = [
+    ("长", "chang", "5"),
+    ("长", "zhang", "9"),
+    ("重", "zhong", "3"),
+    ("长", "chang", "7"),
+    ("重", "chong", "3"),
+    ("行", "xing", "1"),
+]
+
+
+@pytest.mark.parametrize(
+    "key, keep, expected",
+    [
+        ("word", "first", [RECORDS[0], RECORDS[2], RECORDS[5]]),
+        ("word-spell", "first", [RECORDS[0], RECORDS[1], RECORDS[2], RECORDS[4], RECORDS[5]]),
+        # 词频相同时保留先出现的记录，结果保持原来的顺序
+        ("word", "max-freq", [RECORDS[1], RECORDS[2], RECORDS[5]]),
+        ("word-spell", "max-freq", [RECORDS[1], RECORDS[2], RECORDS[3], RECORDS[4], RECORDS[5]]),
+    ],
+)
+def test_in_file_dedup(monkeypatch, key, keep, expected):
+    monkeypatch.setattr(scel_transfer, "COUNTERS", Counter())
+    for records in (RECORDS, RecordTable.from_records(RECORDS)):
+        assert list(InFileDedup(key, keep)(records)) == expected
+    assert scel_transfer.COUNTERS["infile_records"] == 2 * len(RECORDS)
+    assert scel_transfer.COUNTERS["infile_duplicates"] == 2 * (len(RECORDS) - len(expected))
+
+
+def test_in_file_dedup_max_freq_requires_freq():
+    with pytest.raises(ValueError):
+        InFileDedup("word", "max-freq")([record[:2] for record in RECORDS])
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+BlockIndex 按词语、全拼查询的结果与完整解析后逐条比对一致，词库文件变化后索引失效。
+"""
+
+import os
+
+import scel_transfer
+from scel_index import BlockIndex
+
+
+def test_lookup_matches_full_parse(scel):
+    _, records = scel_transfer.read_scel(scel, True)
+    with BlockIndex.open(scel) as index:
+        assert index.word_cnt == len(records)
+        for word, full_spell, _ in records[::97] + records[-3:]:
+            assert index.lookup_word(word, True) == [record for record in records if record[0] == word]
+            assert index.lookup_pinyin(full_spell, True) == [record for record in records if record[1] == full_spell]
+            assert index.lookup_word(word) == [record[:2] for record in records if record[0] == word]
+        assert index.lookup_word("不存在的词语") == []
+        assert index.lookup_pinyin("xyz") == []
+
+
+def test_index_invalidated_when_source_changes(scel):
+    BlockIndex.build(scel).close()
+    index = BlockIndex.load(scel)
+    assert index is not None
+    index.close()
+
+    stat = os.stat(scel)
+    os.utime(scel, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert BlockIndex.load(scel) is None
+    with BlockIndex.open(scel) as index:
+        assert index.word_cnt == len(scel_transfer.read_scel(scel, False)[1])
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+PinyinTrie 的前缀查询与逐条扫描的结果一致，保存后加载的结果不变。
+"""
+
+import scel_transfer
+from pinyin_trie import PinyinTrie, normalize
+
+
+def test_pinyin_trie_query_matches_brute_force(scel, tmp_path):
+    _, records = scel_transfer.read_scel(scel, True)
+    # 较小的 threshold 使查询同时经过预计算的重结点和直接扫描的路径
+    trie = PinyinTrie.build(records, top_k=5, threshold=8)
+
+    def brute_force(prefix, k):
+        key = normalize(prefix)
+        matched = [(record, i) for i, record in enumerate(records) if normalize(record[1]).startswith(key)]
+        matched.sort(key=lambda item: (-int(item[0][2]), normalize(item[0][1]), item[0][1], item[1]))
+        return [record for record, _ in matched[:k]]
+
+    prefixes = ["", "n", "ni", "zh", "zhong", "s", "a", "xyz", "你"] + [record[1] for record in records[:20]]
+    for prefix in prefixes:
+        for k in (1, 5, 12):
+            assert trie.query(prefix, k) == brute_force(prefix, k), (prefix, k)
+
+    path = str(tmp_path / "vocab.trie")
+    trie.save(path)
+    loaded = PinyinTrie.load(path)
+    for prefix in prefixes:
+        assert loaded.query(prefix, 5) == trie.query(prefix, 5)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+监视模式的 SpoolWatcher：文件稳定后才报告，已转写的文件再次变化后重新报告。
+"""
+
+import os
+
+from scel_transfer import SpoolWatcher
+
+
+def test_spool_watcher(tmp_path):
+    watcher = SpoolWatcher(str(tmp_path), settle=0)
+    a, b = str(tmp_path / "a.scel"), str(tmp_path / "b.SCEL")
+    for path in (a, b):
+        with open(path, "wb") as fp:
+            fp.write(b"partial")
+    (tmp_path / "notes.txt").write_text("not a scel")
+    (tmp_path / "dir.scel").mkdir()
+
+    # 第一次看到的文件先等待，大小和修改时间保持不变后才报告
+    assert watcher.ready() == []
+    ready = watcher.ready()
+    assert [path for path, _ in ready] == [a, b]
+    for path, key in ready:
+        watcher.mark_done(path, key)
+    assert watcher.ready() == []
+
+    # 已转写的文件变化后重新报告
+    with open(a, "ab") as fp:
+        fp.write(b" more")
+    assert watcher.ready() == []
+    ((path, key),) = watcher.ready()
+    assert path == a and key[0] == os.path.getsize(a)
+    watcher.mark_done(path, key)
+
+    os.remove(b)
+    assert watcher.ready() == []
+    assert b not in watcher._done
+
+
+def test_spool_watcher_waits_for_settle(tmp_path):
+    watcher = SpoolWatcher(str(tmp_path), settle=3600)
+    (tmp_path / "a.scel").write_bytes(b"data")
+    assert watcher.ready() == []
+    assert watcher.ready() == []